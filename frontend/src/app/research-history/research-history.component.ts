@@ -266,7 +266,7 @@ toggleItemSelection(id: string): void {
     const interval = setInterval(() => {
       this.fetchService.getAnalysisStatus(uid, jobId).subscribe({
         next: (status: any) => {
-          if (status.status === 'processing') {
+          if (status.status === 'processing' || status.status === 'queued') {
             if (status.totalChunks && status.totalChunks > 0 && status.processedChunks < status.totalChunks) {
               const processed = status.processedChunks ?? 0;
               if (processed > 0) {
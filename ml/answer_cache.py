@@ -0,0 +1,99 @@
+"""
+Semantic answer cache for RAG chat.
+
+A cached answer is reused when a new question from the same user has cosine
+similarity >= ANSWER_CACHE_THRESHOLD to a cached question and asks over the
+identical context_ids set. Entries are dropped when the vector store changes
+any doc_id they depend on; unscoped entries (no context_ids) depend on the
+whole library and are dropped on any change for that user.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER", "256"))
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_per_user: int = ANSWER_CACHE_MAX_PER_USER):
+        self.threshold = threshold
+        self.max_per_user = max_per_user
+        self._users = {}  # uid -> OrderedDict[entry_id -> entry]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _context_key(context_ids):
+        return frozenset(context_ids) if context_ids else None
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        v = np.asarray(embedding, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def lookup(self, uid: str, query_embedding, context_ids=None):
+        """Cached answer dict for a near-identical question, or None."""
+        key = self._context_key(context_ids)
+        q = self._unit(query_embedding)
+        with self._lock:
+            entries = self._users.get(uid)
+            candidates = [(eid, e) for eid, e in (entries or {}).items() if e["context"] == key]
+            if candidates:
+                sims = np.stack([e["embedding"] for _, e in candidates]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    eid, entry = candidates[best]
+                    entries.move_to_end(eid)
+                    self.hits += 1
+                    return dict(entry["answer"])
+            self.misses += 1
+            return None
+
+    def store(self, uid: str, query_embedding, context_ids, answer: dict, doc_ids=()):
+        """Cache answer; doc_ids are the papers it was grounded on (plus context_ids)."""
+        with self._lock:
+            entries = self._users.setdefault(uid, OrderedDict())
+            self._next_id += 1
+            entries[self._next_id] = {
+                "embedding": self._unit(query_embedding),
+                "context": self._context_key(context_ids),
+                "doc_ids": set(doc_ids) | set(context_ids or ()),
+                "answer": dict(answer),
+                "created": time.time(),
+            }
+            while len(entries) > self.max_per_user:
+                entries.popitem(last=False)
+
+    def invalidate(self, uid: str, doc_ids):
+        """Drop entries that depend on any of doc_ids, and all unscoped entries of the user."""
+        doc_ids = set(d for d in (doc_ids or ()) if d)
+        with self._lock:
+            entries = self._users.get(uid)
+            if not entries:
+                return
+            stale = [eid for eid, e in entries.items() if e["context"] is None or e["doc_ids"] & doc_ids]
+            for eid in stale:
+                del entries[eid]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": sum(len(e) for e in self._users.values()),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
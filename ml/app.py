@@ -1,19 +1,44 @@
 from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-from langchain_ollama import OllamaLLM
-import fitz  # PyMuPDF
-import os, re, json, requests, uuid
+import os, re, json, uuid
+import asyncio
+import logging
 import tempfile
+import threading
+import time
 from vector_store import vector_store
 from summarizer_agent import extract_section_summaries, rewrite_paragraphs, extract_concepts
-from chat_agent import generate_rag_response
+from chat_agent import agenerate_rag_response, stream_rag_response
+from async_llm import ainvoke_llm, llm_limiter, LLMBusy
+from answer_cache import answer_cache
+from model_registry import get_llm, warmup, resource_stats, current_rss_mb, LLM_CONCURRENCY
+from llm_cache import llm_cache_stats
+from parallel import bounded_map, abounded_map, run_task_graph
+from pdf_text import extract_pdf_text, PDFText
+from pdf_sections import segment_sections
+from job_scheduler import JobTable, JobScheduler, QueueFull, JOB_TTL_HOURS
+from batch_pipeline import StagedPipeline, PipelineStage, PipelineFull
+from downloader import fetch_pdf, DOWNLOAD_CONCURRENCY
+from pdf_store import pdf_store
+from arxiv_feed import fetch_feed, feed_cache
+from fingerprints import fingerprint_index, file_sha256, text_sha256
+import metrics
+from metrics import prompt_config
+
+# LOG_LEVEL=DEBUG restores the old verbose pipeline output
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("app")
 
 app = FastAPI(title="AutoResearch Summarizer + Insight Service")
 
-llm = OllamaLLM(
-    model="llama3:8b",
-    base_url="http://100.74.147.124:11434"
-)
+# Prefetch PDFs listed by /fetch_papers into the local store unless a request says otherwise
+FEED_PREFETCH = os.getenv("FEED_PREFETCH", "0") == "1"
+
+llm = get_llm()
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -25,6 +50,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(LLMBusy)
+async def llm_busy_handler(request, exc: LLMBusy):
+    """Async LLM queue is full (LLM_ASYNC_MAX_WAITING): shed load instead of queueing forever."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 # =============== UTILITY FUNCTIONS ===============
 
 def extract_json_from_text(text: str):
@@ -81,19 +112,8 @@ def normalize_text(value):
 
 def download_pdf(pdf_url: str) -> str:
     """Downloads a PDF to a temporary local file and returns the path."""
-    try:
-        resp = requests.get(pdf_url, timeout=30, allow_redirects=True, stream=True)
-        if resp.status_code == 200:
-            # accept any 200 content but check extension or content-type if available
-            content_type = resp.headers.get("content-type", "")
-            if 'pdf' in content_type.lower() or pdf_url.lower().endswith('.pdf') or len(resp.content) > 100:
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-                temp_file.write(resp.content)
-                temp_file.close()
-                return temp_file.name
-    except Exception as e:
-        print(f"⚠️ Failed to download PDF: {e}")
-    return ""
+    result = fetch_pdf(pdf_url)
+    return result["path"] if result else ""
 
 # =============== DATA MODELS ===============
 
@@ -104,6 +124,7 @@ class PDFData(BaseModel):
     path: str
     metadata: dict | None = None
     uid: str | None = None # Optional for now, but should be required
+    force: bool = False  # re-run the pipeline even if this document was analyzed before
 
 class SummaryData(BaseModel):
     summary: str
@@ -133,25 +154,229 @@ def root():
     return {"message": "AutoResearch Summarizer + Insight Service running ✅"}
 
 
+@app.on_event("startup")
+def warmup_on_startup():
+    # Embedding model and Chroma load lazily on first use unless WARMUP_ON_STARTUP=1
+    if os.getenv("WARMUP_ON_STARTUP", "0") == "1":
+        logger.info(f"🔥 Warming up shared models... {warmup()}")
+
+
+@app.post("/warmup")
+def warmup_models():
+    """Explicitly load the embedding model and Chroma client; returns load stats."""
+    return warmup()
+
+
+@app.get("/resources")
+def get_resources():
+    """Load time and resident memory of the shared model/client registry."""
+    return resource_stats()
+
+
+@app.get("/cache_stats")
+def cache_stats():
+    """Hit/miss counters for the in-process caches."""
+    return {
+        "query_embeddings": vector_store.query_cache.stats(),
+        "llm": llm_cache_stats(),
+        "answers": answer_cache.stats(),
+        "arxiv_feed": feed_cache.stats(),
+        "pdf_store": pdf_store.stats(),
+        "async_llm": llm_limiter.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of stage timings, LLM calls, queue depth and RSS."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # =============== 1️⃣ SUMMARIZATION ENDPOINTS ===============
 
 @app.post("/summarize")
-def summarize_text(data: TextData):
+async def summarize_text(data: TextData):
     text = data.text.strip()
     if not text:
         return {"error": "Empty input text"}
 
     prompt = f"Summarize the following research text in concise academic tone:\n\n{text[:2000]}"
-    result = llm.invoke(prompt)
+    result = await ainvoke_llm(prompt, "summarize")
     return {"summary": result.strip()}
 
 
+# Leaf chunk size, and the most partial-summary text a single merge prompt may carry
+# (llama3:8b's context has to hold it plus the instructions and the output)
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "6000"))
+SUMMARY_MERGE_CHARS = int(os.getenv("SUMMARY_MERGE_CHARS", "5000"))
+# Async /structured_summary: LLM calls one document may have running or queued at once,
+# so a long paper can't fill the async LLM queue and push chat into 503s
+SUMMARY_ASYNC_FANOUT = int(os.getenv("SUMMARY_ASYNC_FANOUT", str(LLM_CONCURRENCY)))
+
+
+def group_by_budget(texts: list, budget: int) -> list:
+    """
+    Split consecutive texts into groups whose joined length fits budget.
+    Groups always hold at least two texts when there are two or more, so
+    every reduce level shrinks the list even if a single text is over budget.
+    """
+    groups, current, size = [], [], 0
+    for text in texts:
+        if current and size + len(text) > budget:
+            groups.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += len(text) + 2
+    if current:
+        groups.append(current)
+    if len(groups) == len(texts) and len(texts) > 1:
+        groups = [texts[i:i + 2] for i in range(0, len(texts), 2)]
+    # A trailing singleton would be re-summarized for nothing; fold it into its neighbour
+    if len(groups) > 1 and len(groups[-1]) == 1:
+        last = groups.pop()
+        groups[-1] = groups[-1] + last
+    return groups
+
+
+def tree_reduce_summaries(summaries: list, merge_fn, budget: int = SUMMARY_MERGE_CHARS, on_level=None) -> list:
+    """
+    Merge groups of consecutive summaries in parallel, level by level, until
+    their combined text fits one prompt of `budget` chars. Returns the
+    remaining summaries in document order; nothing is truncated.
+    on_level(level, groups) is called before each level runs.
+    """
+    level = 0
+    while len(summaries) > 1 and len("\n\n".join(summaries)) > budget:
+        level += 1
+        groups = group_by_budget(summaries, budget)
+        if on_level:
+            on_level(level, len(groups))
+        summaries = bounded_map(merge_fn, groups)
+    return summaries
+
+
+async def atree_reduce_summaries(summaries: list, amerge_fn, budget: int = SUMMARY_MERGE_CHARS) -> list:
+    """tree_reduce_summaries with an async merge_fn; each level runs up to SUMMARY_ASYNC_FANOUT merges at once."""
+    level = 0
+    while len(summaries) > 1 and len("\n\n".join(summaries)) > budget:
+        level += 1
+        groups = group_by_budget(summaries, budget)
+        logger.info(f"🌲 Merge level {level}: {len(groups)} groups")
+        summaries = await abounded_map(amerge_fn, groups, SUMMARY_ASYNC_FANOUT)
+    return summaries
+
+
+def chunk_summary_prompt(chunk: str) -> str:
+    return f"Summarize the following section of a research paper in academic tone:\n\n{chunk}"
+
+
+def merge_group_prompt(group: list) -> str:
+    parts = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(group))
+    return (
+        "Merge the following summaries of consecutive parts of one research paper "
+        "into a single summary in academic tone. Keep every objective, method, dataset, "
+        "numeric result and limitation they mention; only remove repetition.\n\n"
+        f"{parts}"
+    )
+
+
+def structured_merge_prompt(combined_summary: str) -> str:
+    return f"""
+    You are an expert AI research summarizer.
+    Combine all partial summaries into this JSON schema.
+    Output raw JSON only — no markdown, no code fences, no explanation.
+    {{
+        "abstract": "...",
+        "objectives": ["..."],
+        "methodology": "...",
+        "findings": "...",
+        "limitations": "...",
+        "key_points": ["..."]
+    }}
+
+    Summaries:
+    {combined_summary}
+    """
+
+
+def parse_structured_summary(final_summary: str, combined_summary: str, path: str, metadata: dict) -> dict:
+    """Parse the structured merge output and attach the paper's meta block."""
+    # ── DEBUG: raw LLM output ──────────────────────────────────────────────
+    logger.debug(f"RAW FINAL LLM OUTPUT:\n{final_summary}")
+
+    # Strip markdown fences before parsing
+    cleaned_final = re.sub(r"```(?:json)?\s*", "", final_summary).replace("```", "").strip()
+
+    # Use robust JSON extraction
+    extracted = extract_json_from_text(cleaned_final)
+    if extracted is not None:
+        summary_json = extracted
+        logger.debug(f"✅ JSON extracted successfully. Keys: {list(summary_json.keys())}")
+    else:
+        logger.debug(f"⚠️ JSON extraction failed. Storing as raw_summary.")
+        # fallback: store full combined_summary as plain text so document is not empty
+        summary_json = {"raw_summary": combined_summary or final_summary}
+
+    summary_json["meta"] = {
+        "title": metadata.get("title", os.path.basename(path).replace(".pdf", "")),
+        "authors": metadata.get("authors", "Unknown"),
+        "pdf_url": metadata.get("pdf_url", "N/A"),
+        "published": metadata.get("published", "N/A"),
+    }
+
+    logger.info(f"✅ Summary generated for: {summary_json['meta']['title']}")
+    return summary_json
+
+
 @app.post("/structured_summary")
-def summarize_pdf(data: PDFData, job_id: str = None):
+async def summarize_pdf(data: PDFData, job_id: str = None):
+    if job_id:
+        # Progress reporting into analysis_jobs lives on the threaded path
+        return await asyncio.to_thread(summarize_document, data, job_id)
+    return await asummarize_document(data)
+
+
+async def asummarize_document(data: PDFData) -> dict:
+    """
+    summarize_document for async handlers, without job progress. Extraction
+    runs in a worker thread; chunk summaries and each merge level run at most
+    SUMMARY_ASYNC_FANOUT calls at a time, and a failed call cancels the rest.
+    """
+    path = data.path
+    if not path or not os.path.exists(path):
+        return {"error": "Invalid or missing PDF path"}
+    pdf_text = await asyncio.to_thread(extract_pdf_text, path)
+    full_text = pdf_text.text
+
+    if not full_text.strip():
+        return {"error": "No readable text extracted from PDF"}
+
+    chunks = [full_text[i:i + SUMMARY_CHUNK_CHARS] for i in range(0, len(full_text), SUMMARY_CHUNK_CHARS)]
+    logger.info(f"📄 Total chunks: {len(chunks)}")
+
+    async def _summarize_chunk(chunk):
+        return (await ainvoke_llm(chunk_summary_prompt(chunk), "chunk_summary")).strip()
+
+    async def _merge_group(group):
+        return (await ainvoke_llm(merge_group_prompt(group), "intermediate_merge")).strip()
+
+    partial_summaries = await abounded_map(_summarize_chunk, chunks, SUMMARY_ASYNC_FANOUT)
+    reduced = await atree_reduce_summaries(partial_summaries, _merge_group)
+
+    combined_summary = "\n\n".join(reduced)
+    final_summary = await ainvoke_llm(structured_merge_prompt(combined_summary), "merge_summary")
+    return parse_structured_summary(final_summary, combined_summary, path, data.metadata or {})
+
+
+def summarize_document(data: PDFData, job_id: str = None, pdf_text: PDFText = None):
     """
     Summarize a PDF. If job_id is provided, updates analysis_jobs[job_id] with
     per-chunk progress so the frontend can show a live bar.
-    Progress range used: 10% (start) → 55% (all chunks done) → 60% (JSON merged).
+    Pass pdf_text when the caller already extracted the document so it isn't parsed twice.
+    Chunks are summarized in parallel, then tree-reduced (tree_reduce_summaries)
+    until the partial summaries fit one structured merge prompt, so no part of
+    a long paper is dropped and the number of merge levels grows logarithmically.
+    Progress range used: 10% (start) → 70% (all chunks done) → 90% (reduced) → 92% (JSON merged).
     """
     path = data.path
     metadata = data.metadata or {}
@@ -165,128 +390,85 @@ def summarize_pdf(data: PDFData, job_id: str = None):
             if total is not None:
                 analysis_jobs[job_id]["totalChunks"] = total
 
-    if not path or not os.path.exists(path):
-        return {"error": "Invalid or missing PDF path"}
-
-    doc = fitz.open(path)
-    full_text = "".join(page.get_text() for page in doc)
-    doc.close()
+    if pdf_text is None:
+        if not path or not os.path.exists(path):
+            return {"error": "Invalid or missing PDF path"}
+        pdf_text = extract_pdf_text(path)
+    full_text = pdf_text.text
 
     if not full_text.strip():
         return {"error": "No readable text extracted from PDF"}
 
     # Larger chunks = fewer LLM calls = less Ollama context exhaustion
-    CHUNK_SIZE = 6000
-    MAX_CHUNKS = 8      # hard cap: never call the LLM more than 8 times per paper
+    CHUNK_SIZE = SUMMARY_CHUNK_CHARS
     chunks = [full_text[i:i + CHUNK_SIZE] for i in range(0, len(full_text), CHUNK_SIZE)]
-    chunks = chunks[:MAX_CHUNKS]  # drop tail chunks if paper is very long
     total_chunks = len(chunks)
-    print(f"📄 Total chunks (capped at {MAX_CHUNKS}): {total_chunks}")
+    logger.info(f"📄 Total chunks: {total_chunks}")
 
-    # Progress band for chunking: 10% → 90% (80 points spread across chunks)
+    # Progress band for chunking: 10% → 70%, then tree merges 70% → 90%
     CHUNK_START = 10
-    CHUNK_END   = 90
+    CHUNK_END   = 70
+    MERGE_END   = 90
 
-    import time
-    partial_summaries = []
-    for idx, chunk in enumerate(chunks, 1):
-        chunk_pct = CHUNK_START + int((idx - 1) / total_chunks * (CHUNK_END - CHUNK_START))
-        _set_progress(
-            chunk_pct,
-            f"Summarizing chunk {idx} of {total_chunks}...",
-            processed=idx - 1,
-            total=total_chunks
-        )
-        print(f"⚙️ Summarizing chunk {idx}/{total_chunks}... (progress={chunk_pct}%)")
-        prompt = f"Summarize the following section of a research paper in academic tone:\n\n{chunk}"
-        summary = llm.invoke(prompt)
-        partial_summaries.append(summary.strip())
+    _set_progress(
+        CHUNK_START,
+        f"Summarizing {total_chunks} chunks...",
+        processed=0,
+        total=total_chunks
+    )
+
+    def _summarize_chunk(chunk):
+        return llm.invoke(chunk_summary_prompt(chunk), config=prompt_config("chunk_summary")).strip()
+
+    def _on_chunk_done(index, summary, completed):
+        logger.info(f"⚙️ Summarized chunk {index + 1}/{total_chunks} ({completed} done)")
         _set_progress(
-            CHUNK_START + int(idx / total_chunks * (CHUNK_END - CHUNK_START)),
-            f"Summarizing chunk {idx} of {total_chunks}...",
-            processed=idx,
+            CHUNK_START + int(completed / total_chunks * (CHUNK_END - CHUNK_START)),
+            f"Summarized {completed} of {total_chunks} chunks...",
+            processed=completed,
             total=total_chunks
         )
-        if idx < total_chunks:   # no sleep after the last chunk
-            time.sleep(1)       # give Ollama breathing room between calls
+
+    # Chunks run concurrently (bounded by OLLAMA_NUM_PARALLEL); results keep chunk order
+    partial_summaries = bounded_map(_summarize_chunk, chunks, on_result=_on_chunk_done)
 
     # ── DEBUG: inspect chunk results ──────────────────────────────────────
-    print(f"[DEBUG] Total chunk summaries collected: {len(partial_summaries)}")
+    logger.debug(f"Total chunk summaries collected: {len(partial_summaries)}")
     for i, s in enumerate(partial_summaries):
-        print(f"[DEBUG] Chunk {i+1} summary ({len(s)} chars): {s[:120]}...")
+        logger.debug(f"Chunk {i+1} summary ({len(s)} chars): {s[:120]}...")
 
     if job_id and job_id in analysis_jobs:
         analysis_jobs[job_id]["processedChunks"] = 0
         analysis_jobs[job_id]["totalChunks"] = 0
 
-    _set_progress(CHUNK_END, "Merging summaries into structured JSON...")
-    combined_summary = "\n".join(partial_summaries)
-    print(f"[DEBUG] Combined summary length before truncation: {len(combined_summary)} chars")
-
-    # Cap combined_summary to 5000 chars — leaves room for the prompt instructions
-    MAX_MERGE_CHARS = 5000
-    if len(combined_summary) > MAX_MERGE_CHARS:
-        print(f"[DEBUG] ⚠️ Truncating combined_summary from {len(combined_summary)} to {MAX_MERGE_CHARS} chars")
-        combined_summary = combined_summary[:MAX_MERGE_CHARS]
+    def _merge_group(group):
+        return llm.invoke(merge_group_prompt(group), config=prompt_config("intermediate_merge")).strip()
 
-    print(f"[DEBUG] FINAL MERGED SUMMARY (first 500 chars):\n{combined_summary[:500]}")
-
-    final_prompt = f"""
-    You are an expert AI research summarizer.
-    Combine all partial summaries into this JSON schema.
-    Output raw JSON only — no markdown, no code fences, no explanation.
-    {{
-        "abstract": "...",
-        "objectives": ["..."],
-        "methodology": "...",
-        "findings": "...",
-        "limitations": "...",
-        "key_points": ["..."]
-    }}
+    def _on_level(level, groups):
+        logger.info(f"🌲 Merge level {level}: {groups} groups")
+        _set_progress(
+            min(MERGE_END - 2, CHUNK_END + level * 5),
+            f"Merging summaries (level {level}, {groups} groups)..."
+        )
 
-    Summaries:
-    {combined_summary}
-    """
-    final_summary = llm.invoke(final_prompt)
+    reduced = tree_reduce_summaries(partial_summaries, _merge_group, on_level=_on_level)
 
-    _set_progress(92, "Parsing structured summary...")
+    _set_progress(MERGE_END, "Merging summaries into structured JSON...")
+    combined_summary = "\n\n".join(reduced)
+    logger.debug(f"Combined summary length: {len(combined_summary)} chars")
 
-    # ── DEBUG: raw LLM output ──────────────────────────────────────────────
-    print(f"[DEBUG] RAW FINAL LLM OUTPUT:\n{final_summary}")
+    logger.debug(f"FINAL MERGED SUMMARY (first 500 chars):\n{combined_summary[:500]}")
 
-    # Strip markdown fences before parsing
-    cleaned_final = re.sub(r"```(?:json)?\s*", "", final_summary).replace("```", "").strip()
+    final_summary = llm.invoke(structured_merge_prompt(combined_summary), config=prompt_config("merge_summary"))
 
-    # Use robust JSON extraction
-    extracted = extract_json_from_text(cleaned_final)
-    if extracted is not None:
-        summary_json = extracted
-        print(f"[DEBUG] ✅ JSON extracted successfully. Keys: {list(summary_json.keys())}")
-    else:
-        print(f"[DEBUG] ⚠️ JSON extraction failed. Storing as raw_summary.")
-        # fallback: store full combined_summary as plain text so document is not empty
-        summary_json = {"raw_summary": combined_summary or final_summary}
-
-    summary_json["meta"] = {
-        "title": metadata.get("title", os.path.basename(path).replace(".pdf", "")),
-        "authors": metadata.get("authors", "Unknown"),
-        "pdf_url": metadata.get("pdf_url", "N/A"),
-        "published": metadata.get("published", "N/A"),
-    }
-
-    print(f"✅ Summary generated for: {summary_json['meta']['title']}")
-    return summary_json
+    _set_progress(92, "Parsing structured summary...")
+    return parse_structured_summary(final_summary, combined_summary, path, metadata)
 
 
 # =============== 2️⃣ INSIGHT AGENT INTEGRATION ===============
 
-@app.post("/extract_insights")
-def extract_insights(data: SummaryData):
-    summary = data.summary.strip()
-    if not summary:
-        return {"error": "Empty summary input"}
-
-    prompt = f"""
+def insights_prompt(summary: str) -> str:
+    return f"""
     You are an AI research analyst.
     Extract the following structured insights from the summary below.
     Return valid JSON in this schema:
@@ -301,8 +483,9 @@ def extract_insights(data: SummaryData):
     Summary:
     {summary}
     """
-    result = llm.invoke(prompt)
 
+
+def parse_insights(result: str) -> dict:
     # Use robust JSON extraction
     extracted = extract_json_from_text(result)
     if extracted is not None:
@@ -314,6 +497,26 @@ def extract_insights(data: SummaryData):
     return {"insights": insights}
 
 
+def extract_insights(data: SummaryData):
+    """Threaded variant used by the analysis pipeline."""
+    summary = data.summary.strip()
+    if not summary:
+        return {"error": "Empty summary input"}
+
+    result = llm.invoke(insights_prompt(summary), config=prompt_config("insights"))
+    return parse_insights(result)
+
+
+@app.post("/extract_insights")
+async def aextract_insights(data: SummaryData):
+    summary = data.summary.strip()
+    if not summary:
+        return {"error": "Empty summary input"}
+
+    result = await ainvoke_llm(insights_prompt(summary), "insights")
+    return parse_insights(result)
+
+
 # =============== ENRICHMENT PIPELINE ===============
 
 def explode_insights(insights: dict) -> list:
@@ -343,53 +546,87 @@ def explode_insights(insights: dict) -> list:
     return chunks
 
 
-def enrich_paper(uid: str, summary: str, insights: dict, full_text: str, metadata: dict):
+def enrich_paper(uid: str, summary: str, insights: dict, full_text: str, metadata: dict,
+                 pdf_text: PDFText = None, sections: list = None):
     """
     Background task to run the full enrichment pipeline.
+    The stages are independent, so they run concurrently as a task graph;
+    each stage's chunks are stored as soon as that stage finishes, and a
+    failing stage doesn't stop the others. Returns per-stage reports.
+    When pdf_text is given, paragraph chunks carry their page number; pass
+    sections (from segment_sections) when the paper was already segmented.
     """
-    print(f" Starting enrichment for: {metadata.get('title', 'Unknown')} (User: {uid})")
-    
-    all_chunks = []
-    
-    # 1. Section Summaries
-    if full_text:
-        sections = extract_section_summaries(full_text)
-        for sec in sections:
-            all_chunks.append({
+    logger.info(f" Starting enrichment for: {metadata.get('title', 'Unknown')} (User: {uid})")
+
+    def section_stage(_):
+        # Layout-based segmentation needs the PDF itself; falls back to text headings without it
+        pdf_path = pdf_text.path if pdf_text is not None else None
+        chunks = []
+        for sec in extract_section_summaries(full_text, pdf_path=pdf_path, sections=sections):
+            chunk = {
                 "chunk_type": "section_summary",
                 "section": sec.get("section"),
                 "content": sec.get("content")
-            })
-            
-    # 2. Paragraph Rewrites
-    if full_text:
-        rewrites = rewrite_paragraphs(full_text)
-        for i, rw in enumerate(rewrites):
-            all_chunks.append({
+            }
+            if sec.get("page"):
+                chunk["page"] = sec["page"]
+            chunks.append(chunk)
+        return chunks
+
+    def rewrite_stage(_):
+        chunks = []
+        for rw in rewrite_paragraphs(full_text):
+            chunk = {
                 "chunk_type": "paragraph_rewrite",
-                "paragraph_index": i,
-                "content": rw
-            })
-            
-    # 3. Explode Insights
-    insight_chunks = explode_insights(insights)
-    all_chunks.extend(insight_chunks)
-    
-    # 4. Concept Nodes
-    concepts = extract_concepts(summary)
-    for c in concepts:
-        content = f"{c.get('concept')}: {c.get('description')}"
-        all_chunks.append({
+                "paragraph_index": rw["paragraph_index"],
+                "content": rw["content"]
+            }
+            if pdf_text is not None:
+                chunk["page"] = pdf_text.page_for_offset(rw["char_offset"])
+            chunks.append(chunk)
+        return chunks
+
+    def insight_stage(_):
+        return explode_insights(insights)
+
+    def concept_stage(_):
+        return [{
             "chunk_type": "concept",
-            "content": content
-        })
-        
-    # 5. Store all chunks
-    if all_chunks:
-        vector_store.store_enriched_chunks(uid, all_chunks, metadata)
-        print(f" Enrichment completed for: {metadata.get('title')}")
+            "content": f"{c.get('concept')}: {c.get('description')}"
+        } for c in extract_concepts(summary)]
+
+    # name -> (stage function, dependencies)
+    stages = {
+        "insights": (insight_stage, []),
+        "concepts": (concept_stage, []),
+    }
+    if full_text:
+        stages["section_summaries"] = (section_stage, [])
+        stages["paragraph_rewrites"] = (rewrite_stage, [])
+
+    stored = {"count": 0}
+
+    def _store_stage(name, report):
+        chunks = report.get("result") or []
+        if report["status"] != "completed":
+            logger.warning(f"⚠️ Enrichment stage '{name}' {report['status']}: {report.get('error')}")
+            return
+        if chunks:
+            vector_store.store_enriched_chunks(uid, chunks, metadata)
+            stored["count"] += len(chunks)
+        logger.info(f" Stage '{name}' done in {report['seconds']}s ({len(chunks)} chunks)")
+
+    reports = run_task_graph(stages, on_done=_store_stage)
+
+    if stored["count"]:
+        logger.info(f" Enrichment completed for: {metadata.get('title')}")
     else:
-        print("No enrichment chunks generated.")
+        logger.info("No enrichment chunks generated.")
+
+    return {
+        name: {k: v for k, v in r.items() if k != "result"} | {"chunks": len(r.get("result") or [])}
+        for name, r in reports.items()
+    }
 
 
 
@@ -397,11 +634,322 @@ def enrich_paper(uid: str, summary: str, insights: dict, full_text: str, metadat
 
 # =============== 3️⃣ FULL PIPELINE (ASYNC) ===============
 
-analysis_jobs = {}
+def find_existing_analysis(uid: str, content_hash: str = None, text_hash: str = None):
+    """
+    Look up a previously analyzed copy of this document by byte hash, then by
+    normalized-text hash. Another user's copy is re-linked into this user's
+    collection. Returns {"summary", "insights"} or None.
+    """
+    for kind, digest in (("content", content_hash), ("text", text_hash)):
+        for owner_uid, doc_id in fingerprint_index.lookup(kind, digest, uid):
+            existing = vector_store.get_enriched_paper(owner_uid, doc_id, include_summary_json=True)
+            if not existing or not vector_store.chunk_count(owner_uid, doc_id):
+                # Paper was deleted since it was fingerprinted, or has no chunks to answer from
+                fingerprint_index.forget(owner_uid, doc_id)
+                continue
+            if owner_uid != uid:
+                vector_store.copy_paper(owner_uid, uid, doc_id)
+                fingerprint_index.record(uid, doc_id, content_hash, text_hash)
+
+            paper = existing["paper"]
+            meta = paper.get("metadata") or {}
+            try:
+                summary = json.loads(paper.get("summary_json") or "")
+            except Exception:
+                summary = {"raw_summary": paper.get("summary", "")}
+            summary["meta"] = {
+                "title": paper.get("title"),
+                "authors": paper.get("authors"),
+                "pdf_url": paper.get("pdf_url"),
+                "published": paper.get("published"),
+                "doc_id": doc_id,
+                "content_sha256": meta.get("content_sha256"),
+                "text_sha256": meta.get("text_sha256"),
+            }
+            logger.info(f"♻️ Reusing existing analysis of doc {doc_id} (matched {kind} hash)")
+            return {"summary": summary, "insights": paper.get("insights") or {}}
+    return None
+
+
+def _complete_from_existing(job_id: str, existing: dict):
+    analysis_jobs[job_id].update({
+        "progress": 100,
+        "status": "completed",
+        "message": "Done! (already analyzed)",
+        "processedChunks": 0,
+        "totalChunks": 0,
+        "deduplicated": True,
+        "result": existing
+    })
+
+
+# Job state is persisted to SQLite; jobs run on a bounded worker pool (ANALYSIS_WORKERS)
+analysis_jobs = JobTable()
+analysis_scheduler = JobScheduler()
+
+metrics.REGISTRY.gauge(
+    "autoresearch_analysis_queue_depth",
+    "Analysis jobs waiting for a worker.",
+    func=lambda: analysis_scheduler.stats()["queued"],
+)
+metrics.REGISTRY.gauge(
+    "autoresearch_analysis_workers",
+    "Analysis worker threads.",
+    func=lambda: analysis_scheduler.stats()["workers"],
+)
+metrics.REGISTRY.gauge(
+    "autoresearch_process_resident_memory_mb",
+    "Resident set size of the ML service.",
+    func=current_rss_mb,
+)
+
+EMPTY_INSIGHTS = {
+    "findings": [],
+    "methods": [],
+    "datasets": [],
+    "citations": [],
+    "implications": []
+}
+
+
+# ── Analysis stages ──────────────────────────────────────────────────────
+# process_analysis runs these back to back for one paper; /analyze_batch runs
+# them as a staged pipeline across many papers. Each takes the paper's context
+# dict and returns False when the job is already finished (failed or
+# deduplicated), True to continue with the next stage.
+
+def _analysis_context(job_id: str, uid: str, data: PDFData) -> dict:
+    return {
+        "job_id": job_id,
+        "uid": uid,
+        "data": data,
+        "content_hash": None,
+        "text_hash": None,
+        "pdf_text": None,
+        "full_text": "",
+        "pinned_pdf": None,
+        "sections": None,
+    }
+
+
+def _analysis_download(ctx: dict) -> bool:
+    job_id, data = ctx["job_id"], ctx["data"]
+    if data.path.startswith("http"):
+        # Prefetched by /fetch_papers? Then the content hash is known too.
+        # Pinned so eviction can't remove it before enrichment is done with it.
+        downloaded = pdf_store.lookup(data.path, pin=True)
+        if downloaded:
+            ctx["pinned_pdf"] = downloaded["path"]
+            analysis_jobs[job_id]["message"] = "Using prefetched PDF..."
+        else:
+            analysis_jobs[job_id]["message"] = "Downloading PDF..."
+            downloaded = fetch_pdf(data.path)
+        if not downloaded:
+            analysis_jobs[job_id] = {"status": "failed", "error": "Failed to download PDF"}
+            return False
+        data.path = downloaded["path"]
+        ctx["content_hash"] = downloaded["sha256"]
+
+    if ctx["content_hash"] is None:
+        ctx["content_hash"] = file_sha256(data.path)
+    if not data.force:
+        existing = find_existing_analysis(ctx["uid"], content_hash=ctx["content_hash"])
+        if existing:
+            _complete_from_existing(job_id, existing)
+            return False
+    return True
+
+
+def _analysis_extract(ctx: dict) -> bool:
+    job_id, data = ctx["job_id"], ctx["data"]
+    analysis_jobs[job_id]["message"] = "Extracting text..."
+    analysis_jobs[job_id]["progress"] = 10
+
+    # Extracted once here and shared with summarization and enrichment
+    try:
+        ctx["pdf_text"] = extract_pdf_text(data.path)
+        ctx["full_text"] = ctx["pdf_text"].text
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to extract text: {e}")
+
+    full_text = ctx["full_text"]
+    ctx["text_hash"] = text_sha256(full_text) if full_text.strip() else None
+    if not data.force and ctx["text_hash"]:
+        existing = find_existing_analysis(ctx["uid"], content_hash=ctx["content_hash"], text_hash=ctx["text_hash"])
+        if existing:
+            _complete_from_existing(job_id, existing)
+            return False
+
+    # Layout is parsed here, once, while the PDF is certainly on disk; enrichment reuses it
+    if full_text.strip():
+        ctx["sections"] = segment_sections(full_text, data.path)
+    return True
+
+
+def _analysis_summarize(ctx: dict) -> bool:
+    """Structured summary plus insights: the LLM-bound stage."""
+    job_id, data = ctx["job_id"], ctx["data"]
+
+    # Summarize — pass job_id so summarize_document can emit per-chunk progress
+    analysis_jobs[job_id]["message"] = "Starting summarization..."
+    analysis_jobs[job_id]["progress"] = 10
+    summary_data = summarize_document(data, job_id=job_id, pdf_text=ctx["pdf_text"])
+
+    if "error" in summary_data:
+        analysis_jobs[job_id] = {"status": "failed", "error": summary_data["error"]}
+        return False
+
+    analysis_jobs[job_id]["progress"] = 94
+    analysis_jobs[job_id]["message"] = "Extracting insights..."
+
+    # Build normalized summary text from structured fields.
+    # If the LLM returned N/A defaults (parse failed), fall back to raw_summary.
+    PLACEHOLDER = {"N/A", "n/a", "", None}
+
+    abstract    = summary_data.get("abstract", "")
+    objectives  = summary_data.get("objectives", [])
+    methodology = summary_data.get("methodology", "")
+    findings    = summary_data.get("findings", "")
+    limitations = summary_data.get("limitations", "")
+    key_points  = summary_data.get("key_points", [])
+    raw_summary = summary_data.get("raw_summary", "")
+
+    structured_parts = [
+        normalize_text(abstract),
+        normalize_text(objectives),
+        normalize_text(methodology),
+        normalize_text(findings),
+        normalize_text(limitations),
+        normalize_text(key_points),
+    ]
+    summary_text = "\n".join(
+        p for p in structured_parts if p and p.strip() not in PLACEHOLDER
+    ).strip()
+
+    # ── DEBUG ────────────────────────────────────────────────────────
+    logger.debug(f"summary_data keys: {list(summary_data.keys())}")
+    logger.debug(f"abstract  : {str(abstract)[:120]}")
+    logger.debug(f"objectives: {str(objectives)[:120]}")
+    logger.debug(f"methodology: {str(methodology)[:120]}")
+    logger.debug(f"findings  : {str(findings)[:120]}")
+    logger.debug(f"summary_text length: {len(summary_text)} chars")
+    logger.debug(f"summary_text (first 400): {summary_text[:400]}")
+
+    # If all structured fields were N/A placeholders, use raw_summary
+    if not summary_text and raw_summary:
+        logger.debug("⚠️ Structured fields empty — falling back to raw_summary for insight input")
+        summary_text = normalize_text(raw_summary)
+
+    if not summary_text:
+        logger.debug("❌ summary_text is still empty after fallback — skipping insight agent, using empty defaults")
+        insights = dict(EMPTY_INSIGHTS)
+    else:
+        result = extract_insights(SummaryData(summary=summary_text))
+        insights = result.get("insights", result)
+        # Guard: if insight agent returned an error dict, replace with safe defaults
+        if isinstance(insights, dict) and "error" in insights:
+            logger.debug(f"⚠️ Insight agent returned error: {insights['error']} — using empty defaults")
+            insights = dict(EMPTY_INSIGHTS)
+    logger.debug(f"insights result: {str(insights)[:300]}")
+
+    ctx["summary_data"] = summary_data
+    ctx["summary_text"] = summary_text
+    ctx["insights"] = insights
+    return True
+
+
+def _analysis_store(ctx: dict) -> bool:
+    job_id, uid = ctx["job_id"], ctx["uid"]
+    summary_data = ctx["summary_data"]
+    analysis_jobs[job_id]["progress"] = 96
+    analysis_jobs[job_id]["message"] = "Storing in database..."
+
+    doc_id = summary_data["meta"].get("id") or summary_data["meta"].get("doc_id")
+    summary_data["meta"]["content_sha256"] = ctx["content_hash"]
+    if ctx["text_hash"]:
+        summary_data["meta"]["text_sha256"] = ctx["text_hash"]
 
-def process_analysis(job_id: str, uid: str, data: PDFData, background_tasks: BackgroundTasks):
     try:
-        print(f"🚀 Starting background analysis for job {job_id} (User: {uid})...")
+        # The structured summary is kept on the paper entry only (not copied to chunks)
+        # so a later duplicate upload can be answered without the LLM.
+        paper_meta = dict(summary_data["meta"])
+        paper_meta["summary_json"] = json.dumps({k: v for k, v in summary_data.items() if k != "meta"})
+        paper_uid = vector_store.add_paper_to_db(
+            uid=uid,
+            title=summary_data["meta"]["title"],
+            summary=ctx["summary_text"],
+            insights=ctx["insights"],
+            metadata=paper_meta,
+            doc_id=doc_id
+        )
+        if paper_uid:
+            summary_data["meta"]["doc_id"] = paper_uid
+    except Exception as e:
+        logger.warning(f"⚠️ Could not store in ChromaDB: {e}")
+    return True
+
+
+def _analysis_enrich(ctx: dict) -> bool:
+    summary_data = ctx["summary_data"]
+    if ctx["full_text"] and ctx["summary_text"] and summary_data["meta"].get("doc_id"):
+        job_id = ctx["job_id"]
+        analysis_jobs[job_id]["message"] = "Enriching content (background)..."
+        analysis_jobs[job_id]["progress"] = 98
+        reports = enrich_paper(ctx["uid"], ctx["summary_text"], ctx["insights"], ctx["full_text"],
+                               summary_data["meta"], pdf_text=ctx["pdf_text"], sections=ctx["sections"])
+        # Fingerprint only papers that have chunks, so a duplicate upload
+        # never reuses a paper that is still enriching or failed to enrich
+        if any(r.get("chunks") for r in reports.values()):
+            fingerprint_index.record(ctx["uid"], summary_data["meta"]["doc_id"],
+                                     ctx["content_hash"], ctx["text_hash"])
+    return True
+
+
+def _analysis_complete(ctx: dict):
+    job_id = ctx["job_id"]
+    analysis_jobs[job_id]["progress"] = 100
+    analysis_jobs[job_id]["status"] = "completed"
+    analysis_jobs[job_id]["message"] = "Done!"
+    analysis_jobs[job_id]["processedChunks"] = 0
+    analysis_jobs[job_id]["totalChunks"] = 0
+    analysis_jobs[job_id]["result"] = {"summary": ctx["summary_data"], "insights": ctx["insights"]}
+    logger.info(f"✅ Job {job_id} completed.")
+
+
+def _analysis_failed(ctx: dict, error: Exception):
+    job_id = ctx["job_id"]
+    logger.error(f"❌ Job {job_id} failed: {error}")
+    analysis_jobs[job_id] = {"status": "failed", "error": str(error)}
+
+
+def _analysis_cleanup(ctx: dict):
+    job_id, data = ctx["job_id"], ctx["data"]
+    analysis_jobs.save(job_id)
+    if ctx.get("pinned_pdf"):
+        pdf_store.release(ctx["pinned_pdf"])
+    # Delete temp file if it was copied (files in the PDF store are shared and kept)
+    if data.path and data.path.startswith(tempfile.gettempdir()) and not pdf_store.owns(data.path):
+        try:
+            os.unlink(data.path)
+            logger.info(f"🧹 Cleaned up temp upload PDF: {data.path}")
+        except Exception as e:
+            logger.warning(f"Failed to delete temp file: {e}")
+
+
+# Stage order; enrichment chunks reference the stored paper's doc_id, so store precedes enrich
+ANALYSIS_STAGES = [
+    ("download", _analysis_download),
+    ("extract", _analysis_extract),
+    ("summarize", _analysis_summarize),
+    ("store", _analysis_store),
+    ("enrich", _analysis_enrich),
+]
+
+
+def process_analysis(job_id: str, uid: str, data: PDFData):
+    ctx = _analysis_context(job_id, uid, data)
+    try:
+        logger.info(f"🚀 Starting background analysis for job {job_id} (User: {uid})...")
         analysis_jobs[job_id] = {
             "status": "processing", 
             "progress": 0, 
@@ -409,151 +957,19 @@ def process_analysis(job_id: str, uid: str, data: PDFData, background_tasks: Bac
             "processedChunks": 0,
             "totalChunks": 0
         }
-        
-        pdf_path = data.path
-        if pdf_path.startswith("http"):
-            analysis_jobs[job_id]["message"] = "Downloading PDF..."
-            pdf_path = download_pdf(pdf_path)
-            if not pdf_path:
-                analysis_jobs[job_id] = {"status": "failed", "error": "Failed to download PDF"}
+        for _, stage in ANALYSIS_STAGES:
+            if not stage(ctx):
                 return
-
-        data.path = pdf_path
-        
-        # Extract full text
-        analysis_jobs[job_id]["message"] = "Extracting text..."
-        analysis_jobs[job_id]["progress"] = 10
-        
-        full_text = ""
-        try:
-            doc = fitz.open(pdf_path)
-            full_text = "".join(page.get_text() for page in doc)
-            doc.close()
-        except Exception as e:
-            print(f"⚠️ Failed to extract text: {e}")
-
-        # Summarize — pass job_id so summarize_pdf can emit per-chunk progress
-        analysis_jobs[job_id]["message"] = "Starting summarization..."
-        analysis_jobs[job_id]["progress"] = 10
-        summary_data = summarize_pdf(data, job_id=job_id)
-        
-        if "error" in summary_data:
-            analysis_jobs[job_id] = {"status": "failed", "error": summary_data["error"]}
-            return
-
-        analysis_jobs[job_id]["progress"] = 94
-        analysis_jobs[job_id]["message"] = "Extracting insights..."
-
-        # Build normalized summary text from structured fields.
-        # If the LLM returned N/A defaults (parse failed), fall back to raw_summary.
-        PLACEHOLDER = {"N/A", "n/a", "", None}
-
-        abstract    = summary_data.get("abstract", "")
-        objectives  = summary_data.get("objectives", [])
-        methodology = summary_data.get("methodology", "")
-        findings    = summary_data.get("findings", "")
-        limitations = summary_data.get("limitations", "")
-        key_points  = summary_data.get("key_points", [])
-        raw_summary = summary_data.get("raw_summary", "")
-
-        structured_parts = [
-            normalize_text(abstract),
-            normalize_text(objectives),
-            normalize_text(methodology),
-            normalize_text(findings),
-            normalize_text(limitations),
-            normalize_text(key_points),
-        ]
-        summary_text = "\n".join(
-            p for p in structured_parts if p and p.strip() not in PLACEHOLDER
-        ).strip()
-
-        # ── DEBUG ────────────────────────────────────────────────────────
-        print(f"[DEBUG] summary_data keys: {list(summary_data.keys())}")
-        print(f"[DEBUG] abstract  : {str(abstract)[:120]}")
-        print(f"[DEBUG] objectives: {str(objectives)[:120]}")
-        print(f"[DEBUG] methodology: {str(methodology)[:120]}")
-        print(f"[DEBUG] findings  : {str(findings)[:120]}")
-        print(f"[DEBUG] summary_text length: {len(summary_text)} chars")
-        print(f"[DEBUG] summary_text (first 400): {summary_text[:400]}")
-
-        # If all structured fields were N/A placeholders, use raw_summary
-        if not summary_text and raw_summary:
-            print("[DEBUG] ⚠️ Structured fields empty — falling back to raw_summary for insight input")
-            summary_text = normalize_text(raw_summary)
-
-        if not summary_text:
-            print("[DEBUG] ❌ summary_text is still empty after fallback — skipping insight agent, using empty defaults")
-            insights = {
-                "findings": [],
-                "methods": [],
-                "datasets": [],
-                "citations": [],
-                "implications": []
-            }
-        else:
-            result = extract_insights(SummaryData(summary=summary_text))
-            insights = result.get("insights", result)
-            # Guard: if insight agent returned an error dict, replace with safe defaults
-            if isinstance(insights, dict) and "error" in insights:
-                print(f"[DEBUG] ⚠️ Insight agent returned error: {insights['error']} — using empty defaults")
-                insights = {
-                    "findings": [],
-                    "methods": [],
-                    "datasets": [],
-                    "citations": [],
-                    "implications": []
-                }
-        print(f"[DEBUG] insights result: {str(insights)[:300]}")
-
-        analysis_jobs[job_id]["progress"] = 96
-        analysis_jobs[job_id]["message"] = "Storing in database..."
-
-        doc_id = summary_data["meta"].get("id") or summary_data["meta"].get("doc_id")
-        
-        try:
-            paper_uid = vector_store.add_paper_to_db(
-                uid=uid,
-                title=summary_data["meta"]["title"],
-                summary=summary_text,
-                insights=insights,
-                metadata=summary_data["meta"],
-                doc_id=doc_id
-            )
-            if paper_uid:
-                summary_data["meta"]["doc_id"] = paper_uid
-        except Exception as e:
-            print("⚠️ Could not store in ChromaDB:", e)
-
-        # Trigger enrichment
-        if full_text and summary_text and summary_data["meta"].get("doc_id"):
-            analysis_jobs[job_id]["message"] = "Enriching content (background)..."
-            analysis_jobs[job_id]["progress"] = 98
-            enrich_paper(uid, summary_text, insights, full_text, summary_data["meta"])
-
-        analysis_jobs[job_id]["progress"] = 100
-        analysis_jobs[job_id]["status"] = "completed"
-        analysis_jobs[job_id]["message"] = "Done!"
-        analysis_jobs[job_id]["processedChunks"] = 0
-        analysis_jobs[job_id]["totalChunks"] = 0
-        analysis_jobs[job_id]["result"] = {"summary": summary_data, "insights": insights}
-        print(f"✅ Job {job_id} completed.")
+        _analysis_complete(ctx)
 
     except Exception as e:
-        print(f"❌ Job {job_id} failed: {e}")
-        analysis_jobs[job_id] = {"status": "failed", "error": str(e)}
+        _analysis_failed(ctx, e)
     finally:
-        # Delete temp file if it was copied
-        if data.path and data.path.startswith(tempfile.gettempdir()):
-            try:
-                os.unlink(data.path)
-                print(f"🧹 Cleaned up temp upload PDF: {data.path}")
-            except Exception as e:
-                print("Failed to delete temp file:", e)
+        _analysis_cleanup(ctx)
 
 
 @app.post("/analyze_paper")
-def analyze_paper(data: PDFData, background_tasks: BackgroundTasks):
+def analyze_paper(data: PDFData):
     if not data.uid:
         raise HTTPException(400, "UID missing")
         
@@ -564,9 +980,24 @@ def analyze_paper(data: PDFData, background_tasks: BackgroundTasks):
             dst.write(src.read())
         data.path = temp_file.name
 
+    analysis_jobs.cleanup()
+
     job_id = str(uuid.uuid4())
-    background_tasks.add_task(process_analysis, job_id, data.uid, data, background_tasks)
-    return {"job_id": job_id, "status": "processing"}
+    analysis_jobs[job_id] = {
+        "status": "queued",
+        "progress": 0,
+        "message": "Queued...",
+        "processedChunks": 0,
+        "totalChunks": 0
+    }
+    try:
+        position = analysis_scheduler.submit(job_id, process_analysis, job_id, data.uid, data)
+    except QueueFull as e:
+        analysis_jobs[job_id] = {"status": "failed", "error": str(e)}
+        if data.path.startswith(tempfile.gettempdir()):
+            os.unlink(data.path)
+        raise HTTPException(503, str(e))
+    return {"job_id": job_id, "status": "queued", "queue_position": position}
 
 
 @app.get("/analysis_status/{job_id}")
@@ -574,8 +1005,240 @@ async def get_analysis_status(job_id: str):
     job = analysis_jobs.get(job_id)
     if not job:
         return {"status": "not_found"}
+    if job.get("status") == "queued":
+        position = analysis_scheduler.queue_position(job_id)
+        if position is not None:
+            return {**job, "queue_position": position, "message": f"Queued (position {position})"}
     return job
 
+# =============== BATCH ANALYSIS (STAGED PIPELINE) ===============
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_STAGE_QUEUE = int(os.getenv("BATCH_STAGE_QUEUE", "4"))
+# Papers accepted across all batches and not yet finished; /analyze_batch answers 503 beyond this
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", str(2 * BATCH_MAX_ITEMS)))
+# Worker threads per stage. Downloads overlap freely; summarize is the LLM-bound
+# stage, and its workers share the process-wide OLLAMA_NUM_PARALLEL LLM slots
+# with every other caller, so more workers only keep those slots busier.
+BATCH_STAGE_WORKERS = {
+    "download": int(os.getenv("BATCH_DOWNLOAD_WORKERS", str(DOWNLOAD_CONCURRENCY))),
+    "extract": int(os.getenv("BATCH_EXTRACT_WORKERS", "2")),
+    "summarize": int(os.getenv("BATCH_SUMMARIZE_WORKERS", "2")),
+    "store": int(os.getenv("BATCH_STORE_WORKERS", "1")),
+    "enrich": int(os.getenv("BATCH_ENRICH_WORKERS", "1")),
+}
+
+ARXIV_ID_RE = re.compile(
+    r"^(?:arxiv:)?((?:\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?)$",
+    re.IGNORECASE
+)
+
+
+class BatchAnalysisRequest(BaseModel):
+    uid: str
+    items: list[str]  # PDF URLs or arXiv IDs ("2401.12345", "arXiv:2401.12345v2", "cs/0112017")
+    force: bool = False
+
+
+def resolve_batch_source(item: str):
+    """(pdf_url, metadata) for a PDF URL or arXiv ID, or None if unrecognised."""
+    item = (item or "").strip()
+    match = ARXIV_ID_RE.match(item)
+    if match:
+        arxiv_id = match.group(1)
+        return f"https://arxiv.org/pdf/{arxiv_id}", {"title": arxiv_id, "pdf_url": f"https://arxiv.org/pdf/{arxiv_id}"}
+    if item.startswith(("http://", "https://")):
+        return item, {"pdf_url": item}
+    return None
+
+
+def _batch_stage(name: str, func):
+    def run(ctx):
+        analysis_jobs[ctx["job_id"]].update({"status": "processing", "stage": name})
+        return func(ctx)
+    return run
+
+
+def _batch_queued(ctx: dict, stage: str):
+    job = analysis_jobs.get(ctx["job_id"])
+    if job is not None and job.get("status") not in ("completed", "failed"):
+        job.update({"stage": stage, "message": f"Waiting for {stage}..."})
+
+
+batch_pipeline = StagedPipeline(
+    [
+        PipelineStage(name, _batch_stage(name, func), BATCH_STAGE_WORKERS[name], BATCH_STAGE_QUEUE)
+        for name, func in ANALYSIS_STAGES
+    ],
+    on_queued=_batch_queued,
+    on_error=lambda ctx, stage, e: _analysis_failed(ctx, e),
+    on_complete=_analysis_complete,
+    on_exit=_analysis_cleanup,
+    max_in_flight=BATCH_MAX_IN_FLIGHT,
+)
+analysis_batches = {}  # batch_id -> {"uid", "created", "jobs": [{"job_id", "source"}]}
+_batches_lock = threading.Lock()
+
+metrics.REGISTRY.gauge(
+    "autoresearch_batch_stage_queue_depth",
+    "Batch papers waiting for each pipeline stage.",
+    ("stage",),
+    func=lambda: {(s.name,): s.queue.qsize() for s in batch_pipeline.stages},
+)
+metrics.REGISTRY.gauge(
+    "autoresearch_batch_stage_busy",
+    "Batch pipeline workers currently running, per stage.",
+    ("stage",),
+    func=lambda: {(name,): st["busy"] for name, st in batch_pipeline.stats()["stages"].items()},
+)
+
+
+@app.post("/analyze_batch")
+def analyze_batch(data: BatchAnalysisRequest):
+    """
+    Analyze many papers through the staged pipeline (download → extract →
+    summarize/insights → store → enrich), each stage with its own workers and
+    bounded queue so downloads and extraction overlap the LLM work.
+    Every paper gets a normal job (see /analysis_status); poll /batch_status
+    for aggregate progress. Answers 503 when the batch would take the pipeline
+    past BATCH_MAX_IN_FLIGHT papers.
+    """
+    if not data.uid:
+        raise HTTPException(400, "UID missing")
+    if not data.items:
+        raise HTTPException(400, "No items to analyze")
+    if len(data.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"At most {BATCH_MAX_ITEMS} items per batch")
+
+    analysis_jobs.cleanup()
+    cutoff = time.time() - JOB_TTL_HOURS * 3600
+    with _batches_lock:
+        for old_id in [b for b, batch in analysis_batches.items() if batch["created"] < cutoff]:
+            del analysis_batches[old_id]
+
+    batch_id = str(uuid.uuid4())
+    jobs, rejected, contexts = [], [], []
+    for item in data.items:
+        resolved = resolve_batch_source(item)
+        if resolved is None:
+            rejected.append(item)
+            continue
+        url, metadata = resolved
+        job_id = str(uuid.uuid4())
+        analysis_jobs[job_id] = {
+            "status": "queued",
+            "progress": 0,
+            "message": "Queued...",
+            "processedChunks": 0,
+            "totalChunks": 0,
+            "batch_id": batch_id,
+            "source": item,
+        }
+        pdf_data = PDFData(path=url, metadata=metadata, uid=data.uid, force=data.force)
+        contexts.append(_analysis_context(job_id, data.uid, pdf_data))
+        jobs.append({"job_id": job_id, "source": item})
+
+    try:
+        batch_pipeline.submit(contexts)
+    except PipelineFull as e:
+        for entry in jobs:
+            analysis_jobs[entry["job_id"]] = {"status": "failed", "error": str(e)}
+        raise HTTPException(503, str(e))
+    with _batches_lock:
+        analysis_batches[batch_id] = {"uid": data.uid, "created": time.time(), "jobs": jobs}
+    return {"batch_id": batch_id, "status": "queued", "jobs": jobs, "rejected": rejected}
+
+
+@app.get("/batch_status/{batch_id}")
+def get_batch_status(batch_id: str):
+    """Aggregate progress of a batch plus per-paper status and pipeline stage load."""
+    with _batches_lock:
+        batch = analysis_batches.get(batch_id)
+    if batch is None:
+        return {"status": "not_found"}
+
+    papers = []
+    counts = {"queued": 0, "processing": 0, "completed": 0, "failed": 0}
+    progress_total = 0
+    for entry in batch["jobs"]:
+        job = analysis_jobs.get(entry["job_id"]) or {"status": "failed", "error": "Job expired"}
+        status = job.get("status", "queued")
+        counts[status] = counts.get(status, 0) + 1
+        progress_total += 100 if status in ("completed", "failed") else job.get("progress", 0)
+        summary_meta = ((job.get("result") or {}).get("summary") or {}).get("meta") or {}
+        papers.append({
+            "job_id": entry["job_id"],
+            "source": entry["source"],
+            "status": status,
+            "stage": job.get("stage"),
+            "progress": job.get("progress", 0),
+            "message": job.get("message"),
+            "error": job.get("error"),
+            "doc_id": summary_meta.get("doc_id"),
+        })
+
+    total = len(papers)
+    done = counts["completed"] + counts["failed"]
+    return {
+        "batch_id": batch_id,
+        "status": "completed" if done == total else ("processing" if counts["processing"] or done else "queued"),
+        "total": total,
+        "counts": counts,
+        "progress": round(progress_total / total) if total else 100,
+        "jobs": papers,
+        "pipeline": batch_pipeline.stats(),
+    }
+
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+@app.get("/analysis_events/{job_id}")
+async def stream_analysis_events(job_id: str):
+    """
+    Server-sent events for one analysis job. Pushes a `progress` event on every
+    status/progress/message/chunk-count change and a final `completed` or
+    `failed` event, then closes the stream.
+    """
+    if analysis_jobs.get(job_id) is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+
+    async def event_stream():
+        updates = analysis_jobs.subscribe(job_id)
+        try:
+            last_sent = None
+            job = dict(await get_analysis_status(job_id))
+            while True:
+                status = job.get("status")
+                if status in ("completed", "failed"):
+                    yield _sse(status, job)
+                    return
+                if job != last_sent:
+                    yield _sse("progress", job)
+                    last_sent = job
+                try:
+                    # Queued jobs re-check their position even without a change
+                    timeout = 2 if status == "queued" else 15
+                    job = await asyncio.wait_for(updates.get(), timeout=timeout)
+                    # Several fields often change together; only send the latest
+                    while not updates.empty():
+                        job = updates.get_nowait()
+                except asyncio.TimeoutError:
+                    if status != "queued":
+                        yield ": keep-alive\n\n"
+                if job.get("status") == "queued":
+                    job = dict(await get_analysis_status(job_id))
+        finally:
+            analysis_jobs.unsubscribe(job_id, updates)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 # =============== 4️⃣ CHROMA DB STORAGE & SEARCH ===============
 
@@ -610,19 +1273,18 @@ def store_paper(data: PaperStoreRequest, background_tasks: BackgroundTasks):
         if pdf_url and pdf_url != "N/A":
             # We need to fetch text. This might be slow, so definitely background it.
             def fetch_and_enrich(uid, url, summary, insights, meta):
-                print("Downloading PDF for enrichment...")
+                logger.info("Downloading PDF for enrichment...")
                 path = download_pdf(url)
                 if path:
                     try:
-                        doc = fitz.open(path)
-                        text = "".join(page.get_text() for page in doc)
-                        doc.close()
-                        os.remove(path) # Clean up
-                        enrich_paper(uid, summary, insights, text, meta)
+                        pdf_text = extract_pdf_text(path)
+                        enrich_paper(uid, summary, insights, pdf_text.text, meta, pdf_text=pdf_text)
                     except Exception as e:
-                        print(f"Failed to extract text for enrichment: {e}")
+                        logger.warning(f"Failed to extract text for enrichment: {e}")
+                    finally:
+                        os.remove(path) # Clean up after enrichment, which reads the PDF layout
                 else:
-                    print("Failed to download PDF for enrichment")
+                    logger.warning("Failed to download PDF for enrichment")
 
             background_tasks.add_task(fetch_and_enrich, data.uid, pdf_url, data.summary, data.insights, data.metadata)
         else:
@@ -646,21 +1308,44 @@ def search_papers(data: PaperQueryRequest):
 
 
 @app.post("/chat_rag")
-def chat_rag(data: ChatRequest):
+async def chat_rag(data: ChatRequest):
     """
     RAG Chat endpoint.
     Retrieves enriched chunks, compresses context, and generates answer.
+    Async: a request waiting on the LLM holds a coroutine, not a threadpool thread.
     """
     try:
         if not data.uid:
             raise HTTPException(400, "UID missing")
-        response = generate_rag_response(data.uid, data.message, data.context_ids)
+        response = await agenerate_rag_response(data.uid, data.message, data.context_ids)
         return response
+    except LLMBusy:
+        raise
     except Exception as e:
-        print(f"⚠️ Chat RAG error: {e}")
+        logger.warning(f"⚠️ Chat RAG error: {e}")
         return {"error": str(e)}
 
 
+@app.post("/chat_rag/stream")
+def chat_rag_stream(data: ChatRequest):
+    """
+    Streaming RAG chat over server-sent events: `token` events carry answer
+    text as it is generated, then a `sources` event and a final `done` event.
+    """
+    if not data.uid:
+        raise HTTPException(400, "UID missing")
+
+    def event_stream():
+        for event in stream_rag_response(data.uid, data.message, data.context_ids):
+            yield _sse(event["type"], event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/get_enriched_paper/{paper_id}")
 def get_enriched_paper(paper_id: str, uid: str):
     """
@@ -682,86 +1367,62 @@ def get_enriched_paper(paper_id: str, uid: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"⚠️ Error fetching enriched paper: {e}")
+        logger.warning(f"⚠️ Error fetching enriched paper: {e}")
         return {"error": str(e)}
 
 
 # =============== 5️⃣ CLEANUP ORPHANS ===============
 
 @app.delete("/cleanup_orphans")
-def cleanup_orphans(uid: str):
+def cleanup_orphans(uid: str, dry_run: bool = False, rescan: bool = False):
     """
     Find and delete all paper entries in ChromaDB that have zero enriched chunks.
     These are papers where the enrichment pipeline failed or never ran, so RAG
     always falls back to the general LLM with 'No relevant chunks found'.
 
+    Orphans come from the maintained per-user chunk-count index, so a call is
+    a set lookup. The collection is scanned only the first time the user's
+    index is needed, or when rescan=true. Candidates are confirmed with one
+    bulk chunk lookup, then deleted in batched calls.
+    With dry_run=true nothing is deleted.
+
     Returns:
-      - deleted_ids: list of doc_ids removed from ChromaDB
-      - kept_ids:    list of doc_ids that had chunks and were kept
+      - deleted_ids:  list of doc_ids removed (or that would be removed) from ChromaDB
+      - kept_ids:     list of doc_ids that had chunks and were kept
+      - chunk_counts: {doc_id: number of enriched chunks} for every paper
     """
     if not uid:
         raise HTTPException(400, "uid is required")
 
     try:
-        collection = vector_store.get_collection(uid)
+        if rescan:
+            vector_store.rebuild_chunk_index(uid)
+        # Re-check candidates against Chroma so a paper whose chunks are landing right now is kept
+        deleted_ids = vector_store.confirm_orphans(uid, sorted(vector_store.orphan_doc_ids(uid)))
+        chunk_counts = vector_store.chunk_index.chunk_counts(uid)
 
-        # 1. Fetch every paper entry for this user
-        paper_results = collection.get(
-            where={"entry_type": "paper"},
-            include=["metadatas", "documents"]
-        )
+        if not chunk_counts:
+            return {"message": "No papers found for this user.", "deleted_ids": [], "kept_ids": [], "chunk_counts": {}}
 
-        paper_ids   = paper_results.get("ids", [])
-        paper_metas = paper_results.get("metadatas", [])
+        kept_ids = sorted(doc_id for doc_id, count in chunk_counts.items() if count)
+        for doc_id in deleted_ids:
+            logger.info(f"🗑️ Orphan detected: doc_id={doc_id}")
 
-        if not paper_ids:
-            return {"message": "No papers found for this user.", "deleted_ids": [], "kept_ids": []}
-
-        deleted_ids = []
-        kept_ids    = []
-
-        for i, pid in enumerate(paper_ids):
-            meta    = paper_metas[i] if i < len(paper_metas) else {}
-            doc_id  = meta.get("doc_id") or pid
-            title   = meta.get("title", "Untitled")
-
-            # 2. Count enriched chunks linked to this paper
-            try:
-                chunk_results = collection.get(
-                    where={"$and": [
-                        {"entry_type": "chunk"},
-                        {"doc_id": doc_id}
-                    ]},
-                    include=[]   # only need IDs — no document content needed
-                )
-                chunk_count = len(chunk_results.get("ids", []))
-            except Exception as e:
-                print(f"⚠️ Could not count chunks for {doc_id}: {e}")
-                chunk_count = 0
-
-            if chunk_count == 0:
-                # 3. Orphan — delete the paper entry itself from ChromaDB
-                print(f"🗑️ Orphan detected: '{title}' (doc_id={doc_id}, chroma_id={pid}) → deleting")
-                try:
-                    # Delete by ChromaDB internal ID
-                    collection.delete(ids=[pid])
-                    # Also sweep by doc_id metadata in case of duplicate entries
-                    collection.delete(where={"doc_id": doc_id})
-                except Exception as e:
-                    print(f"⚠️ Failed to delete orphan {doc_id}: {e}")
-                deleted_ids.append(doc_id)
-            else:
-                print(f"✅ Kept: '{title}' (doc_id={doc_id}, chunks={chunk_count})")
-                kept_ids.append(doc_id)
+        if deleted_ids and not dry_run:
+            # Paper entries are stored under their doc_id; the doc_id sweep catches duplicates
+            vector_store.delete_entries(uid, deleted_ids, deleted_ids)
 
+        verb = "would be removed" if dry_run else "removed"
         return {
-            "message": f"Cleanup complete. {len(deleted_ids)} orphan(s) removed from ChromaDB.",
+            "message": f"Cleanup complete. {len(deleted_ids)} orphan(s) {verb} from ChromaDB.",
+            "dry_run": dry_run,
             "deleted_ids": deleted_ids,
-            "kept_ids":    kept_ids
+            "kept_ids":    kept_ids,
+            "chunk_counts": chunk_counts
         }
 
     except Exception as e:
-        print(f"❌ cleanup_orphans error: {e}")
+        logger.error(f"❌ cleanup_orphans error: {e}")
         raise HTTPException(500, str(e))
 
 
@@ -775,11 +1436,8 @@ def debug_job(job_id: str):
     if not job:
         return {"status": "not_found", "job_id": job_id}
     import json as _json
-    # Pretty print to terminal as well
-    print(f"\n{'='*60}")
-    print(f"[DEBUG] Full job result for {job_id}:")
-    print(_json.dumps(job, indent=2, default=str))
-    print(f"{'='*60}\n")
+    # Pretty print to the log as well
+    logger.debug(f"Full job result for {job_id}:\n{_json.dumps(job, indent=2, default=str)}")
     return job
 
 
@@ -797,88 +1455,27 @@ def debug_list_papers(uid: str, limit: int = 10):
 # =============== 6️⃣ FETCH PAPERS FROM ARXIV ===============
 
 @app.get("/fetch_papers")
-def fetch_papers(category: str = "cs.AI", max_results: int = 5):
-    """
-    Fetch latest research papers from arXiv.
-    Example: /fetch_papers?category=cs.AI&max_results=10
-    """
-    base_url = "http://export.arxiv.org/api/query"
-    params = {
-        "search_query": f"cat:{category}",
-        "start": 0,
-        "max_results": max_results,
-        "sortBy": "submittedDate",
-        "sortOrder": "descending"
-    }
-
-    response = requests.get(base_url, params=params)
-    if response.status_code != 200:
+def fetch_papers(category: str = "cs.AI", max_results: int = 5, start: int = 0, prefetch: bool = None):
+    """
+    Fetch latest research papers from arXiv, one page at a time.
+    Example: /fetch_papers?category=cs.AI&max_results=10&start=20
+    Pages are cached briefly; with prefetch=true (or FEED_PREFETCH=1) the listed
+    PDFs are downloaded into the local PDF store in the background so a
+    follow-up /analyze_paper on their URLs starts without a download.
+    """
+    if start < 0 or max_results < 1:
+        raise HTTPException(400, "start must be >= 0 and max_results >= 1")
+    try:
+        page = fetch_feed(category, start=start, max_results=max_results)
+    except Exception as e:
+        logger.warning(f"⚠️ arXiv fetch failed: {e}")
         return {"error": "Failed to fetch from arXiv"}
+    if "error" in page:
+        return page
 
-    import xml.etree.ElementTree as ET
-    root = ET.fromstring(response.text)
-    ns = {"atom": "http://www.w3.org/2005/Atom"}
-
-    papers = []
-
-    for entry in root.findall("atom:entry", ns):
-        # --- Extract basic info ---
-        title_el = entry.find("atom:title", ns)
-        summary_el = entry.find("atom:summary", ns)
-        title = title_el.text.strip() if title_el is not None else "Untitled"
-        summary = summary_el.text.strip() if summary_el is not None else ""
-
-        # --- Authors ---
-        authors_list = []
-        for a in entry.findall("atom:author", ns):
-            name_el = a.find("atom:name", ns)
-            if name_el is not None:
-                authors_list.append(name_el.text)
-        authors = ", ".join(authors_list) if authors_list else "Unknown"
-
-        # --- Published Date ---
-        published_el = entry.find("atom:published", ns)
-        published = published_el.text[:10] if published_el is not None else "N/A"
-
-        # --- Try to get PDF link ---
-        pdf_url = None
-        for link in entry.findall("atom:link", ns):
-            href = link.attrib.get("href", "")
-            title_attr = link.attrib.get("title", "").lower()
-            type_attr = link.attrib.get("type", "")
-            rel_attr = link.attrib.get("rel", "")
-
-            if title_attr == "pdf" and href:
-                pdf_url = href
-                break
-            if type_attr == "application/pdf" and href:
-                pdf_url = href
-                break
-            if rel_attr == "related" and href.endswith(".pdf"):
-                pdf_url = href
-                break
-
-        # --- Fallback: construct PDF link from arXiv ID ---
-        if not pdf_url:
-            id_el = entry.find("atom:id", ns)
-            if id_el is not None and id_el.text:
-                abs_url = id_el.text.strip()  # e.g. http://arxiv.org/abs/2401.12345
-                if "/abs/" in abs_url:
-                    pdf_url = abs_url.replace("/abs/", "/pdf/")
-                    if not pdf_url.endswith(".pdf"):
-                        pdf_url += ".pdf"
-                else:
-                    pdf_url = abs_url
-
-        papers.append({
-            "title": title,
-            "summary": summary,
-            "authors": authors,
-            "publishedDate": published,
-            "pdf_url": pdf_url or "N/A"
-        })
-
-    return {"papers": papers}
+    if prefetch if prefetch is not None else FEED_PREFETCH:
+        page = {**page, "prefetching": pdf_store.prefetch([p["pdf_url"] for p in page["papers"]])}
+    return page
 
 # =============== 7️⃣ DELETE PAPER FROM CHROMADB ===============
 
@@ -894,7 +1491,8 @@ def delete_paper(paper_id: str, uid: str):
              raise HTTPException(400, "UID missing")
 
         vector_store.delete_paper(uid, paper_id)
+        fingerprint_index.forget(uid, paper_id)
         return {"message": f"Deleted paper {paper_id} successfully ✅"}
     except Exception as e:
-        print("⚠️ Error deleting paper:", e)
+        logger.warning(f"⚠️ Error deleting paper: {e}")
         return {"error": str(e)}
@@ -0,0 +1,183 @@
+"""
+arXiv listing feed for /fetch_papers.
+
+Requests go through the shared pooled HTTP session, the Atom response is
+parsed incrementally while it streams in (each <entry> is converted and then
+cleared), and parsed pages are cached for FEED_CACHE_TTL seconds keyed by
+(category, start, max_results). ARXIV_API_URL can point at a local stand-in.
+"""
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+from downloader import get_http_session
+from metrics import span
+
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query")
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "300"))
+FEED_CACHE_SIZE = 256
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+
+class FeedCache:
+    """Small TTL + LRU cache of parsed feed pages."""
+
+    def __init__(self, ttl: float = FEED_CACHE_TTL, max_size: int = FEED_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+feed_cache = FeedCache()
+
+
+def _text(elem, tag: str) -> str:
+    child = elem.find(tag)
+    return (child.text or "").strip() if child is not None and child.text else ""
+
+
+def entry_to_paper(entry) -> dict:
+    """Convert one Atom <entry> element into the /fetch_papers paper dict."""
+    title = _text(entry, f"{ATOM}title") or "Untitled"
+    summary = _text(entry, f"{ATOM}summary")
+
+    authors_list = [
+        name.text for name in (a.find(f"{ATOM}name") for a in entry.findall(f"{ATOM}author"))
+        if name is not None and name.text
+    ]
+    authors = ", ".join(authors_list) if authors_list else "Unknown"
+
+    published = _text(entry, f"{ATOM}published")
+    published = published[:10] if published else "N/A"
+
+    # --- Try to get PDF link ---
+    pdf_url = None
+    for link in entry.findall(f"{ATOM}link"):
+        href = link.attrib.get("href", "")
+        title_attr = link.attrib.get("title", "").lower()
+        type_attr = link.attrib.get("type", "")
+        rel_attr = link.attrib.get("rel", "")
+
+        if title_attr == "pdf" and href:
+            pdf_url = href
+            break
+        if type_attr == "application/pdf" and href:
+            pdf_url = href
+            break
+        if rel_attr == "related" and href.endswith(".pdf"):
+            pdf_url = href
+            break
+
+    # --- Fallback: construct PDF link from arXiv ID ---
+    if not pdf_url:
+        abs_url = _text(entry, f"{ATOM}id")  # e.g. http://arxiv.org/abs/2401.12345
+        if abs_url:
+            if "/abs/" in abs_url:
+                pdf_url = abs_url.replace("/abs/", "/pdf/")
+                if not pdf_url.endswith(".pdf"):
+                    pdf_url += ".pdf"
+            else:
+                pdf_url = abs_url
+
+    return {
+        "title": title,
+        "summary": summary,
+        "authors": authors,
+        "publishedDate": published,
+        "pdf_url": pdf_url or "N/A"
+    }
+
+
+def parse_feed(stream):
+    """
+    Incrementally parse an Atom feed from a file-like stream.
+    Returns (papers, total_results); total_results is None if the feed omits it.
+    """
+    papers = []
+    total_results = None
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        if elem.tag == f"{ATOM}entry":
+            papers.append(entry_to_paper(elem))
+            elem.clear()
+        elif elem.tag == f"{OPENSEARCH}totalResults" and elem.text:
+            try:
+                total_results = int(elem.text)
+            except ValueError:
+                pass
+    return papers, total_results
+
+
+def fetch_feed(category: str = "cs.AI", start: int = 0, max_results: int = 5) -> dict:
+    """
+    Latest papers in an arXiv category, one page at a time.
+    Returns {"papers", "start", "max_results", "total_results", "next_start", "cached"}
+    or {"error"}; errors are not cached.
+    """
+    key = (category, start, max_results)
+    cached = feed_cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    params = {
+        "search_query": f"cat:{category}",
+        "start": start,
+        "max_results": max_results,
+        "sortBy": "submittedDate",
+        "sortOrder": "descending"
+    }
+    with span("http", "arxiv_feed"):
+        with get_http_session().get(ARXIV_API_URL, params=params, timeout=30, stream=True) as response:
+            if response.status_code != 200:
+                return {"error": "Failed to fetch from arXiv"}
+            response.raw.decode_content = True
+            papers, total_results = parse_feed(response.raw)
+
+    next_start = start + len(papers)
+    page = {
+        "papers": papers,
+        "start": start,
+        "max_results": max_results,
+        "total_results": total_results,
+        "next_start": next_start if papers and (total_results is None or next_start < total_results) else None,
+    }
+    feed_cache.put(key, page)
+    return {**page, "cached": False}
@@ -0,0 +1,87 @@
+"""
+Async access to the shared Ollama LLM for request handlers.
+
+Sync handlers hold a threadpool thread for the whole of llm.invoke(), so the
+threadpool size caps how many requests can wait on Ollama. Async handlers
+await ainvoke() instead: the call goes out over OllamaLLM's pooled httpx
+AsyncClient and a waiting request costs a coroutine, not a thread.
+
+Calls to Ollama draw on the same process-wide LLM_CONCURRENCY slots as the
+threaded pipeline (model_registry.llm_slot). In front of that, at most
+LLM_CONCURRENCY async calls contend for a slot and the rest wait on a
+semaphore. Once LLM_ASYNC_MAX_WAITING calls are queued, ainvoke() raises
+LLMBusy and the endpoint answers 503 instead of letting latency grow without
+bound. Only call these from the service's event loop: the limiter and the
+pooled client belong to that loop.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+from model_registry import get_llm, LLM_CONCURRENCY, LLM_ASYNC_MAX_WAITING
+from metrics import REGISTRY, prompt_config
+
+
+class LLMBusy(Exception):
+    """Raised when too many async LLM calls are already waiting for a slot."""
+
+
+class AsyncLimiter:
+    """Semaphore plus waiting/active counters, created lazily on the running loop."""
+
+    def __init__(self, limit: int, max_waiting: int):
+        self.limit = max(1, limit)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.active = 0
+        self._sem = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        if self.max_waiting > 0 and self._sem.locked() and self.waiting >= self.max_waiting:
+            raise LLMBusy(f"LLM is busy ({self.waiting} requests waiting)")
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "max_waiting": self.max_waiting,
+            "active": self.active,
+            "waiting": self.waiting,
+        }
+
+
+llm_limiter = AsyncLimiter(LLM_CONCURRENCY, LLM_ASYNC_MAX_WAITING)
+
+REGISTRY.gauge(
+    "autoresearch_llm_async_waiting",
+    "Async LLM calls waiting for a concurrency slot.",
+    func=lambda: llm_limiter.waiting,
+)
+REGISTRY.gauge(
+    "autoresearch_llm_async_active",
+    "Async LLM calls past the queue, taking or holding a process-wide LLM slot.",
+    func=lambda: llm_limiter.active,
+)
+
+
+async def ainvoke(runnable, inputs, prompt_type: str):
+    """Await runnable.ainvoke(inputs) within the async concurrency limit, tagged with prompt_type."""
+    async with llm_limiter.slot():
+        return await runnable.ainvoke(inputs, config=prompt_config(prompt_type))
+
+
+async def ainvoke_llm(prompt: str, prompt_type: str) -> str:
+    """ainvoke() on the shared LLM with a plain prompt string."""
+    return await ainvoke(get_llm(), prompt, prompt_type)
@@ -0,0 +1,174 @@
+"""
+Staged worker pipeline for bulk ingestion.
+
+Every stage owns a pool of worker threads and a bounded input queue. A worker
+hands its finished item to the next stage's queue and blocks while that queue
+is full, so I/O- and CPU-bound stages (download, extraction) run ahead of the
+LLM stage only as far as the queues allow, and the LLM stage always has
+papers waiting instead of idling between them.
+
+One feeder thread moves submitted items into the first stage. submit() raises
+PipelineFull once max_in_flight items are in the pipeline, so callers can push
+back instead of queueing without bound.
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineFull(Exception):
+    """Raised when accepting a submission would exceed the pipeline's max_in_flight."""
+
+
+class PipelineStage:
+    """One stage: func(item) -> truthy to pass the item on, falsy if the item is finished early."""
+
+    def __init__(self, name: str, func, workers: int = 1, max_queue: int = 8):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, max_queue))
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "queued": self.queue.qsize(),
+                "max_queue": self.queue.maxsize,
+                "processed": self.processed,
+                "failed": self.failed,
+                "seconds": round(self.seconds, 3),
+            }
+
+
+class StagedPipeline:
+    """
+    Runs items through a list of PipelineStages in order.
+
+    Callbacks (all optional, called from worker threads):
+      on_queued(item, stage_name)      item is waiting for stage_name
+      on_error(item, stage_name, exc)  stage raised; the item leaves the pipeline
+      on_complete(item)                item passed the last stage
+      on_exit(item)                    item left the pipeline, whatever the outcome
+    """
+
+    def __init__(self, stages: list, on_queued=None, on_error=None, on_complete=None, on_exit=None,
+                 max_in_flight: int = 0):
+        self.stages = stages
+        self.max_in_flight = max_in_flight  # 0 = unlimited
+        self.on_queued = on_queued
+        self.on_error = on_error
+        self.on_complete = on_complete
+        self.on_exit = on_exit
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._in_flight = 0
+        self._count_lock = threading.Lock()
+        # Bounded by max_in_flight: items are counted before they are put here
+        self._intake = queue.Queue()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._feed, name="batch-feeder", daemon=True).start()
+            for index, stage in enumerate(self.stages):
+                for i in range(stage.workers):
+                    threading.Thread(
+                        target=self._worker, args=(index,), name=f"batch-{stage.name}-{i}", daemon=True
+                    ).start()
+
+    def _enqueue(self, index: int, item):
+        stage = self.stages[index]
+        if self.on_queued:
+            self.on_queued(item, stage.name)
+        stage.queue.put(item)  # blocks while the stage is saturated
+
+    def _callback(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.warning(f"⚠️ Pipeline callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+    def _leave(self, item):
+        self._callback(self.on_exit, item)
+        with self._count_lock:
+            self._in_flight -= 1
+
+    def _feed(self):
+        while True:
+            self._enqueue(0, self._intake.get())
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        while True:
+            item = stage.queue.get()
+            with stage._lock:
+                stage.busy += 1
+            start = time.perf_counter()
+            failed = False
+            try:
+                keep_going = stage.func(item)
+            except Exception as e:
+                failed = True
+                keep_going = False
+                logger.error(f"❌ Batch stage '{stage.name}' failed: {e}")
+                self._callback(self.on_error, item, stage.name, e)
+            finally:
+                with stage._lock:
+                    stage.busy -= 1
+                    stage.processed += 1
+                    stage.failed += int(failed)
+                    stage.seconds += time.perf_counter() - start
+                stage.queue.task_done()
+
+            if not keep_going:
+                self._leave(item)
+            elif index + 1 < len(self.stages):
+                self._enqueue(index + 1, item)
+            else:
+                self._callback(self.on_complete, item)
+                self._leave(item)
+
+    def submit(self, items: list):
+        """
+        Hand items to the feeder thread, so callers return immediately while the
+        first queue applies backpressure. Raises PipelineFull, accepting none of
+        the items, if they would take the pipeline past max_in_flight.
+        """
+        items = list(items)
+        if not items:
+            return
+        self._ensure_started()
+        with self._count_lock:
+            if self.max_in_flight > 0 and self._in_flight + len(items) > self.max_in_flight:
+                raise PipelineFull(
+                    f"Batch pipeline is full ({self._in_flight} of {self.max_in_flight} papers in flight)"
+                )
+            self._in_flight += len(items)
+        for item in items:
+            self._intake.put(item)
+
+    @property
+    def in_flight(self) -> int:
+        with self._count_lock:
+            return self._in_flight
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "stages": {stage.name: stage.stats() for stage in self.stages},
+        }
@@ -0,0 +1,148 @@
+"""
+Stand-in arXiv export API for offline tests of /fetch_papers.
+
+Serves /api/query with a generated Atom feed honouring search_query, start and
+max_results (plus opensearch:totalResults), and /pdf/<id> with a small
+synthetic PDF, each after a configurable latency.
+
+Run standalone and point the service at it:
+    python benchmarks/fake_arxiv.py --port 8765 --latency 0.3
+    ARXIV_API_URL=http://127.0.0.1:8765/api/query uvicorn app:app
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+TOTAL_RESULTS = 500
+
+
+def make_pdf_bytes(arxiv_id: str) -> bytes:
+    """Minimal single-page PDF whose content depends on the ID."""
+    text = f"Synthetic paper {arxiv_id}".replace("(", "").replace(")", "")
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_feed(base_url: str, category: str, start: int, max_results: int) -> str:
+    entries = []
+    for n in range(start, min(start + max_results, TOTAL_RESULTS)):
+        arxiv_id = f"2401.{n:05d}v1"
+        entries.append(f"""
+  <entry>
+    <id>{base_url}/abs/{arxiv_id}</id>
+    <published>2024-01-{1 + n % 28:02d}T00:00:00Z</published>
+    <title>Synthetic {escape(category)} paper number {n}</title>
+    <summary>An abstract for synthetic paper {n} in {escape(category)}.</summary>
+    <author><name>Author {n % 7}</name></author>
+    <author><name>Author {(n + 3) % 7}</name></author>
+    <link href="{base_url}/pdf/{arxiv_id}" rel="related" title="pdf" type="application/pdf"/>
+  </entry>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <title>Fake arXiv query results</title>
+  <opensearch:totalResults>{TOTAL_RESULTS}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>{"".join(entries)}
+</feed>
+"""
+
+
+class FakeArxiv:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2):
+        self.latency = latency
+        self.feed_requests = 0
+        self.pdf_requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                time.sleep(fake.latency)
+                if parsed.path == "/api/query":
+                    with fake._lock:
+                        fake.feed_requests += 1
+                    q = parse_qs(parsed.query)
+                    category = q.get("search_query", ["cat:cs.AI"])[0].split(":", 1)[-1]
+                    start = int(q.get("start", ["0"])[0])
+                    max_results = int(q.get("max_results", ["10"])[0])
+                    feed = make_feed(fake.url, category, start, max_results)
+                    self._send(200, "application/atom+xml; charset=utf-8", feed.encode())
+                elif parsed.path.startswith("/pdf/"):
+                    with fake._lock:
+                        fake.pdf_requests += 1
+                    self._send(200, "application/pdf", make_pdf_bytes(parsed.path[len("/pdf/"):]))
+                else:
+                    self._send(404, "text/plain", b"not found")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+    fake = FakeArxiv(port=args.port, latency=args.latency).start()
+    print(f"Fake arXiv API at {fake.url}/api/query (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
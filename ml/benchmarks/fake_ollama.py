@@ -0,0 +1,198 @@
+"""
+Stand-in Ollama HTTP server for offline benchmarks.
+
+Implements /api/generate (streaming NDJSON and non-streaming), /api/chat,
+/api/tags and /api/version with canned, schema-valid outputs picked from
+the prompt type used by the pipeline, and configurable latency:
+
+    total delay = base_latency + output_tokens * per_token_latency
+
+Run standalone:
+    python benchmarks/fake_ollama.py --port 11435 --base-latency 0.5 --per-token 0.01
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMMARY_JSON = {
+    "abstract": "The paper proposes a synthetic method and evaluates it on benchmark data.",
+    "objectives": ["Measure pipeline throughput", "Exercise every prompt type"],
+    "methodology": "A controlled experiment with generated documents.",
+    "findings": "Throughput scales with the number of parallel model slots.",
+    "limitations": "Outputs are canned and do not reflect model quality.",
+    "key_points": ["Deterministic outputs", "Configurable latency"],
+}
+INSIGHTS_JSON = {
+    "findings": ["Batching embeddings reduces ingestion time considerably.",
+                 "Concurrent chunk summaries shorten end-to-end latency."],
+    "methods": ["Synthetic PDF generation with PyMuPDF.", "Stubbed LLM server with fixed latency."],
+    "datasets": ["Synthetic-Papers-Bench v1 generated locally."],
+    "citations": ["Benchmark harness reference implementation (2024)."],
+    "implications": ["Performance changes can be compared reproducibly offline."],
+}
+CONCEPTS_JSON = [
+    {"concept": f"Concept {i}", "description": f"Synthetic concept number {i} used for benchmarking."}
+    for i in range(1, 11)
+]
+FILLER = ("This section describes the experimental setup, the data used, and the main results "
+          "obtained by the proposed approach in a concise academic tone. ")
+
+
+def canned_response(prompt: str) -> str:
+    """Pick an output matching the prompt type the pipeline sent."""
+    p = prompt.lower()
+    if "rewrite each numbered paragraph" in p:
+        indices = [int(i) for i in re.findall(r"^\s*\[(\d+)\]", prompt, re.MULTILINE)]
+        return json.dumps([{"index": i, "rewrite": f"Rewritten paragraph {i}. " + FILLER} for i in indices])
+    if "combine all partial summaries" in p or "return only valid json in this exact format" in p and "abstract" in p:
+        return json.dumps(SUMMARY_JSON)
+    if "structured insights" in p or '"findings"' in p and '"datasets"' in p:
+        return json.dumps(INSIGHTS_JSON)
+    if "summarize the section" in p:
+        return "Synthetic section summary. " + FILLER
+    if "core concepts" in p:
+        return json.dumps(CONCEPTS_JSON)
+    if "researchgpt" in p or "research assistant" in p:
+        if "json" in p:
+            return json.dumps({"answer": "A synthetic grounded answer. " + FILLER, "sources": []})
+        return "A synthetic grounded answer. " + FILLER
+    return FILLER * 3
+
+
+class FakeOllama:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, base_latency: float = 0.2,
+                 per_token_latency: float = 0.0, model: str = "llama3:8b"):
+        self.base_latency = base_latency
+        self.per_token_latency = per_token_latency
+        self.model = model
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": fake.model, "model": fake.model}]})
+                elif self.path == "/api/version":
+                    self._json(200, {"version": "0.0.0-fake"})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/generate":
+                    prompt = body.get("prompt", "")
+                elif self.path == "/api/chat":
+                    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                else:
+                    self._json(404, {"error": "not found"})
+                    return
+                fake._respond(self, body, canned_response(prompt), chat=self.path == "/api/chat")
+
+        return Handler
+
+    def _respond(self, handler, body: dict, text: str, chat: bool):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            tokens = re.findall(r"\S+\s*", text) or [text]
+            time.sleep(self.base_latency)
+            now = datetime.now(timezone.utc).isoformat()
+            final = {
+                "model": body.get("model", self.model), "created_at": now, "done": True,
+                "done_reason": "stop", "total_duration": 0, "load_duration": 0,
+                "prompt_eval_count": len(body.get("prompt", "")) // 4, "prompt_eval_duration": 0,
+                "eval_count": len(tokens), "eval_duration": 0,
+            }
+
+            def piece(t):
+                return {"message": {"role": "assistant", "content": t}} if chat else {"response": t}
+
+            if body.get("stream", True):
+                handler.send_response(200)
+                handler.send_header("Content-Type", "application/x-ndjson")
+                handler.send_header("Transfer-Encoding", "chunked")
+                handler.end_headers()
+
+                def write_chunk(obj):
+                    data = (json.dumps(obj) + "\n").encode()
+                    handler.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    handler.wfile.flush()
+
+                for t in tokens:
+                    if self.per_token_latency:
+                        time.sleep(self.per_token_latency)
+                    write_chunk({"model": final["model"], "created_at": now, "done": False, **piece(t)})
+                write_chunk({**final, **piece("")})
+                handler.wfile.write(b"0\r\n\r\n")
+            else:
+                time.sleep(self.per_token_latency * len(tokens))
+                handler._json(200, {**final, **piece(text)})
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--base-latency", type=float, default=0.5)
+    parser.add_argument("--per-token", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeOllama(port=args.port, base_latency=args.base_latency, per_token_latency=args.per_token).start()
+    print(f"Fake Ollama listening on {fake.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
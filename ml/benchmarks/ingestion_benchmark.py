@@ -0,0 +1,242 @@
+"""
+Offline end-to-end ingestion benchmark.
+
+Starts the fake Ollama server (benchmarks/fake_ollama.py), points the service
+at it together with a throwaway Chroma/SQLite directory, generates synthetic
+PDFs of several lengths and drives:
+
+  1. process_analysis directly, one paper at a time, reporting per-stage wall
+     time (extraction, summarization, insights, paper store, enrichment,
+     embedding, Chroma writes) and peak RSS;
+  2. the /analyze_paper API with a burst of papers, polling /analysis_status,
+     reporting end-to-end papers/hour.
+
+Only the sentence-transformers model must be available locally; no Ollama box
+is needed.
+
+Usage (from ml/):
+    python benchmarks/ingestion_benchmark.py --pages 5 20 60 --batch 6 \
+        --base-latency 0.5 --per-token 0.005 --parallel 4 --json bench.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+from fake_ollama import FakeOllama  # noqa: E402
+
+PARAGRAPH = (
+    "In this section we study {topic} using a controlled experimental protocol. "
+    "We describe the data collection procedure, the model architecture and the "
+    "training objective, and we analyse the effect of each design choice on the "
+    "final accuracy. Results on paragraph {n} indicate consistent improvements "
+    "over strong baselines across all evaluated settings."
+)
+TOPICS = ["retrieval", "summarization", "graph learning", "vision", "speech", "robotics"]
+
+
+def make_pdf(path: str, pages: int, seed: int = 0):
+    """Write a synthetic paper of `pages` pages with blank-line separated paragraphs."""
+    import fitz
+    doc = fitz.open()
+    n = 0
+    for p in range(pages):
+        page = doc.new_page()
+        heading = "Abstract" if p == 0 else f"{p}. Section {p}"
+        paragraphs = []
+        for _ in range(4):
+            n += 1
+            paragraphs.append(PARAGRAPH.format(topic=TOPICS[(n + seed) % len(TOPICS)], n=f"{seed}-{n}"))
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), heading + "\n\n" + "\n\n".join(paragraphs), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+class StageTimer:
+    """Wraps callables and accumulates wall time per stage name."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, attr: str, stage: str):
+        original = getattr(owner, attr)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.totals[stage] += time.perf_counter() - start
+                    self.calls[stage] += 1
+
+        setattr(owner, attr, timed)
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+            self.calls.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: {"seconds": round(v, 3), "calls": self.calls[k]} for k, v in self.totals.items()}
+
+
+class RSSSampler:
+    """Samples process RSS in the background and keeps the peak."""
+
+    def __init__(self, rss_fn, interval: float = 0.05):
+        self.rss_fn = rss_fn
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = self.rss_fn()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss_fn())
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 60])
+    parser.add_argument("--batch", type=int, default=4, help="papers submitted at once through /analyze_paper")
+    parser.add_argument("--batch-pages", type=int, default=10)
+    parser.add_argument("--base-latency", type=float, default=0.5)
+    parser.add_argument("--per-token", type=float, default=0.0)
+    parser.add_argument("--parallel", type=int, default=4, help="OLLAMA_NUM_PARALLEL seen by the service")
+    parser.add_argument("--llm-cache", action="store_true", help="leave the persistent LLM cache enabled")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    workdir = tempfile.mkdtemp(prefix="ingest_bench_")
+    fake = FakeOllama(base_latency=args.base_latency, per_token_latency=args.per_token).start()
+    os.environ.update({
+        "OLLAMA_API_URL": fake.url,
+        "OLLAMA_NUM_PARALLEL": str(args.parallel),
+        "CHROMA_PATH": os.path.join(workdir, "chroma"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "LLM_CACHE_ENABLED": "1" if args.llm_cache else "0",
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.db"),
+        "FINGERPRINT_DB_PATH": os.path.join(workdir, "fingerprints.db"),
+    })
+    os.chdir(workdir)  # summary side files land in the scratch dir
+
+    import app as service
+    from model_registry import current_rss_mb, warmup
+
+    timer = StageTimer()
+    timer.wrap(service, "extract_pdf_text", "pdf_extraction")
+    timer.wrap(service, "summarize_document", "summarization")
+    timer.wrap(service, "extract_insights", "insights")
+    timer.wrap(service, "enrich_paper", "enrichment")
+    timer.wrap(service.vector_store, "add_paper_to_db", "paper_store")
+    timer.wrap(service.vector_store, "embed_batch", "embedding")
+    timer.wrap(service.vector_store, "store_enriched_chunks", "chunk_store_total")
+
+    print(f"Fake Ollama at {fake.url}; scratch dir {workdir}")
+    warmup()
+    results = {"config": vars(args), "papers": [], "api_batch": None}
+
+    # 1. Direct pipeline, one paper per size
+    for pages in args.pages:
+        pdf = os.path.join(workdir, f"paper_{pages}p.pdf")
+        make_pdf(pdf, pages, seed=pages)
+        run_copy = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
+        shutil.copy(pdf, run_copy)
+
+        timer.reset()
+        job_id = str(uuid.uuid4())
+        requests_before = fake.requests
+        with RSSSampler(current_rss_mb) as rss:
+            start = time.perf_counter()
+            service.process_analysis(job_id, "bench", service.PDFData(path=run_copy, uid="bench", force=True))
+            wall = time.perf_counter() - start
+        stages = timer.snapshot()
+        chunk_total = stages.get("chunk_store_total", {}).get("seconds", 0.0)
+        embed = stages.get("embedding", {}).get("seconds", 0.0)
+        stages["chroma_write"] = {"seconds": round(max(0.0, chunk_total - embed), 3)}
+        row = {
+            "pages": pages,
+            "status": service.analysis_jobs.get(job_id, {}).get("status"),
+            "wall_seconds": round(wall, 3),
+            "llm_requests": fake.requests - requests_before,
+            "peak_rss_mb": round(rss.peak, 1),
+            "stages": stages,
+        }
+        results["papers"].append(row)
+        print(f"\n== {pages} pages: {row['status']} in {wall:.2f}s, {row['llm_requests']} LLM calls, "
+              f"peak RSS {rss.peak:.0f} MB")
+        for name, s in sorted(stages.items(), key=lambda kv: -kv[1]["seconds"]):
+            print(f"   {name:<20} {s['seconds']:>8.3f}s" + (f"  ({s['calls']} calls)" if "calls" in s else ""))
+
+    # 2. Burst through the API
+    from fastapi.testclient import TestClient
+    client = TestClient(service.app)
+    job_ids = []
+    with RSSSampler(current_rss_mb) as rss:
+        start = time.perf_counter()
+        for i in range(args.batch):
+            pdf = os.path.join(workdir, f"batch_{i}.pdf")
+            make_pdf(pdf, args.batch_pages, seed=1000 + i)
+            resp = client.post("/analyze_paper", json={"path": pdf, "uid": "bench", "force": True})
+            job_ids.append(resp.json().get("job_id"))
+        pending = set(filter(None, job_ids))
+        statuses = {}
+        while pending:
+            time.sleep(0.2)
+            for jid in list(pending):
+                status = client.get(f"/analysis_status/{jid}").json().get("status")
+                if status in ("completed", "failed"):
+                    statuses[jid] = status
+                    pending.discard(jid)
+        wall = time.perf_counter() - start
+    completed = sum(1 for s in statuses.values() if s == "completed")
+    results["api_batch"] = {
+        "papers": args.batch,
+        "completed": completed,
+        "wall_seconds": round(wall, 3),
+        "papers_per_hour": round(completed / wall * 3600, 1) if wall else 0.0,
+        "peak_rss_mb": round(rss.peak, 1),
+        "max_llm_in_flight": fake.max_in_flight,
+    }
+    b = results["api_batch"]
+    print(f"\n== API burst: {b['completed']}/{b['papers']} papers in {b['wall_seconds']}s "
+          f"→ {b['papers_per_hour']} papers/hour, peak RSS {b['peak_rss_mb']} MB, "
+          f"max LLM calls in flight {b['max_llm_in_flight']}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {json_path}")
+
+    fake.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
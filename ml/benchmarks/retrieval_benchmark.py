@@ -0,0 +1,108 @@
+"""
+Latency and recall of hybrid (BM25 + dense, RRF) vs pure-vector retrieval,
+and of the full chat retrieval path (chat_agent.retrieve_chunks: hybrid
+candidates re-ranked with MMR).
+
+Builds a synthetic corpus in a throwaway Chroma directory where every chunk
+mentions a unique exact-match identifier (dataset name / model acronym), then
+asks questions that name the identifier and checks whether the chunk holding
+it comes back in the top k.
+
+Usage (from ml/):
+    python benchmarks/retrieval_benchmark.py --chunks 2000 --queries 200 --k 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+TOPICS = [
+    "image classification", "machine translation", "speech recognition",
+    "graph representation learning", "reinforcement learning for robotics",
+    "protein structure prediction", "question answering", "anomaly detection",
+]
+TEMPLATES = [
+    "We evaluate our {topic} approach on the {ident} dataset and report improved accuracy.",
+    "The {ident} model is trained for {topic} with a contrastive objective.",
+    "Ablations on {ident} show that {topic} benefits from larger batch sizes.",
+    "Compared with prior {topic} baselines, {ident} reduces error by a wide margin.",
+]
+QUESTIONS = [
+    "What results are reported on {ident}?",
+    "How does {ident} perform?",
+    "Which experiments use {ident}?",
+]
+
+
+def make_identifier(rng: random.Random) -> str:
+    letters = "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ") for _ in range(rng.randint(2, 4)))
+    return f"{letters}-{rng.randint(10, 9999)}"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["CHROMA_PATH"] = tempfile.mkdtemp(prefix="bench_chroma_")
+    # The shared instance, so retrieve_chunks below searches the same indexes
+    from vector_store import vector_store as store
+    from chat_agent import retrieve_chunks
+
+    rng = random.Random(args.seed)
+    uid = "bench"
+
+    idents = []
+    chunks = []
+    for i in range(args.chunks):
+        ident = make_identifier(rng)
+        idents.append(ident)
+        chunks.append({
+            "chunk_type": "finding",
+            "content": rng.choice(TEMPLATES).format(topic=rng.choice(TOPICS), ident=ident),
+        })
+    start = time.perf_counter()
+    store.store_enriched_chunks(uid, chunks, {"doc_id": "bench-doc", "title": "Synthetic"})
+    print(f"Indexed {len(chunks)} chunks in {time.perf_counter() - start:.2f}s")
+
+    targets = rng.sample(range(args.chunks), min(args.queries, args.chunks))
+    queries = [(rng.choice(QUESTIONS).format(ident=idents[i]), idents[i]) for i in targets]
+
+    # Build the BM25 index and warm the query path before timing
+    store.lexical_index(uid)
+    store.query_enriched_chunks(uid, "warmup", n_results=args.k)
+
+    modes = (
+        ("vector", lambda q: store.query_enriched_chunks(uid, q, n_results=args.k, hybrid=False)),
+        ("hybrid", lambda q: store.query_enriched_chunks(uid, q, n_results=args.k, hybrid=True)),
+        ("chat", lambda q: retrieve_chunks(uid, q, k=args.k)),
+    )
+    for label, retrieve in modes:
+        store.query_cache.clear()
+        latencies, hits = [], 0
+        for question, ident in queries:
+            t0 = time.perf_counter()
+            results = retrieve(question)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += any(ident in r["content"] for r in results)
+        print(
+            f"{label:>6}: recall@{args.k}={hits / len(queries):.3f}  "
+            f"latency mean={statistics.mean(latencies):.1f}ms p95={percentile(latencies, 95):.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
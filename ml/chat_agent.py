@@ -1,32 +1,54 @@
 # ml/chat_agent.py
+import asyncio
 import json
+import logging
+import os
 import re
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
-from langchain_ollama import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-from vector_store import VectorStore  # local module in ml/
-# If your project structure differs, adjust import accordingly.
+from vector_store import vector_store  # shared process-wide instance
+from model_registry import get_llm
+from reranking import mmr_rerank
+from context_packing import pack_context
+from answer_cache import answer_cache
+from metrics import prompt_config
+from async_llm import ainvoke, LLMBusy
 
-# Instantiate vector store (wrapper around Chroma/client)
-vector_store = VectorStore()
+logger = logging.getLogger(__name__)
 
-# Instantiate LLM
-llm = OllamaLLM(
-    model="llama3:8b",
-    base_url="http://100.74.147.124:11434"
-)
+llm = get_llm()
 
+# Drop cached answers whenever the papers they depend on change
+vector_store.on_change(answer_cache.invalidate)
 
-def compress_context(chunks: List[dict]) -> str:
+# Retrieval: fetch RAG_FETCH_K candidates, keep RAG_TOP_K diverse ones via MMR
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", "20"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.6"))
+
+# Over-long context is packed extractively ("extractive") or summarized by the LLM ("llm")
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "extractive")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+
+
+def retrieve_chunks(uid: str, message: str, context_ids: Optional[List[str]] = None,
+                    k: int = RAG_TOP_K, fetch_k: int = RAG_FETCH_K, lambda_mult: float = RAG_MMR_LAMBDA) -> List[dict]:
     """
-    Compress retrieved chunks into a readable research digest.
+    Retrieve fetch_k candidates and re-rank them with maximal marginal relevance
+    so near-duplicates (a finding, its paragraph rewrite and a section summary
+    saying the same thing) don't crowd the context.
     """
-    if not chunks:
-        return ""
+    candidates = vector_store.query_enriched_chunks(
+        uid=uid, query=message, n_results=fetch_k, doc_ids=context_ids, include_embeddings=True
+    )
+    # Chunks keep their "embedding" so compress_context can score sentences without re-encoding
+    return mmr_rerank(vector_store.embed_query(message), candidates, k=k, lambda_mult=lambda_mult)
+
 
+def _combine_chunks(chunks: List[dict]) -> str:
     combined_text = ""
     for c in chunks:
         meta = c.get("metadata", {}) or {}
@@ -35,57 +57,108 @@ def compress_context(chunks: List[dict]) -> str:
         type_ = meta.get("chunk_type", "fragment")
         content = c.get("content", "") or c.get("document", "") or ""
         combined_text += f"--- Source: {title} (ID: {doc_id}, Type: {type_}) ---\n{content}\n\n"
+    return combined_text
 
-    # If the combined text is already short enough, return it
-    if len(combined_text) < 4000:
-        return combined_text
 
-    # Otherwise use the LLM to compress (keep attribution)
-    prompt_template = """
+def _extractive_context(chunks: List[dict], query: str) -> str:
+    query_embedding = vector_store.embed_query(query) if query else None
+    return pack_context(chunks, query, query_embedding, token_budget=CONTEXT_TOKEN_BUDGET)
+
+
+COMPRESSION_PROMPT = ChatPromptTemplate.from_template("""
     Summarize and distill these research fragments into a compact representation while preserving key details, methods, and findings.
     Keep the source attributions clear.
 
     Fragments:
     {context}
+    """)
+
+
+def _compressed_text(compressed) -> str:
+    # If the chain returned structured JSON, extract string; else return as-is
+    if isinstance(compressed, str):
+        return compressed
+    try:
+        # If StrOutputParser returned JSON-like, try to stringify/return
+        return json.dumps(compressed)[:4000]
+    except Exception:
+        return str(compressed)[:4000]
+
+
+def compress_context(chunks: List[dict], query: str = "", mode: str = None) -> str:
     """
+    Compress retrieved chunks into a readable research digest.
+    Short contexts pass through unchanged. Longer ones are packed extractively
+    within CONTEXT_TOKEN_BUDGET (default) or, with mode="llm", summarized by the LLM.
+    """
+    if not chunks:
+        return ""
+
+    combined_text = _combine_chunks(chunks)
+
+    # If the combined text is already short enough, return it
+    if len(combined_text) < 4000:
+        return combined_text
+
+    if (mode or CONTEXT_COMPRESSION) != "llm":
+        return _extractive_context(chunks, query)
 
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    chain = prompt | llm | StrOutputParser()
+    # Otherwise use the LLM to compress (keep attribution)
+    chain = COMPRESSION_PROMPT | llm | StrOutputParser()
 
     try:
         # slice to a safe length to avoid model input overflow
-        compressed = chain.invoke({"context": combined_text[:12000]})
-        # If the chain returned structured JSON, extract string; else return as-is
-        if isinstance(compressed, str):
-            return compressed
-        try:
-            # If StrOutputParser returned JSON-like, try to stringify/return
-            return json.dumps(compressed)[:4000]
-        except Exception:
-            return str(compressed)[:4000]
+        compressed = chain.invoke({"context": combined_text[:12000]}, config=prompt_config("context_compression"))
+        return _compressed_text(compressed)
     except Exception as e:
-        print(f"⚠️ Context compression failed: {e}")
+        logger.warning(f"⚠️ Context compression failed: {e}")
         return combined_text[:4000]
 
 
-def generate_rag_response(uid: str, message: str, context_ids: Optional[List[str]] = None) -> dict:
-    """
-    Full RAG pipeline: Retrieve -> Compress -> Generate.
-    Returns a dict: {"answer": str, "sources": [ {title, doc_id, chunk_type, section?}, ... ] }
-    """
-    try:
-        print(f"🤖 RAG Chat: '{message}' (uid={uid}, context_ids={context_ids})")
+async def acompress_context(chunks: List[dict], query: str = "", mode: str = None) -> str:
+    """compress_context for async handlers: packing runs in a worker thread, LLM compression is awaited."""
+    if not chunks:
+        return ""
 
-        # 1. Retrieve (user-scoped)
-        chunks = vector_store.query_enriched_chunks(uid=uid, query=message, n_results=10, doc_ids=context_ids)
+    combined_text = _combine_chunks(chunks)
+    if len(combined_text) < 4000:
+        return combined_text
+
+    if (mode or CONTEXT_COMPRESSION) != "llm":
+        return await asyncio.to_thread(_extractive_context, chunks, query)
+
+    chain = COMPRESSION_PROMPT | llm | StrOutputParser()
+    try:
+        compressed = await ainvoke(chain, {"context": combined_text[:12000]}, "context_compression")
+        return _compressed_text(compressed)
+    except LLMBusy:
+        raise
     except Exception as e:
-        print(f"⚠️ Retrieval failed: {e}")
-        chunks = []
+        logger.warning(f"⚠️ Context compression failed: {e}")
+        return combined_text[:4000]
 
-    # If no chunks found, fallback to general LLM answer
-    if not chunks:
-        print("⚠️ No relevant chunks found. Falling back to general LLM.")
-        prompt_template = """
+
+def sources_from_chunks(chunks: List[dict], limit: int = 10) -> List[dict]:
+    """Build a de-duplicated source list from retrieved chunks' metadata."""
+    unique_sources = {}
+    for c in chunks:
+        meta = c.get("metadata", {}) or {}
+        doc_id = meta.get("doc_id") or meta.get("id") or meta.get("document_id")
+        key = f"{doc_id}_{meta.get('chunk_type')}"
+        if doc_id and key not in unique_sources:
+            unique_sources[key] = {
+                "title": meta.get("title", "Unknown"),
+                "doc_id": doc_id,
+                "chunk_type": meta.get("chunk_type", "generic"),
+                "section": meta.get("section", "General")
+            }
+    return list(unique_sources.values())[:limit]
+
+
+FALLBACK_ERROR_ANSWER = "I couldn't find any research on that, and I had trouble generating a general answer."
+GENERATION_ERROR_ANSWER = "Sorry, I encountered an error generating the answer."
+
+FALLBACK_PROMPT = ChatPromptTemplate.from_template("""
         You are a helpful research assistant.
         The user asked: "{question}"
 
@@ -95,32 +168,9 @@ def generate_rag_response(uid: str, message: str, context_ids: Optional[List[str
           "answer": "...",
           "sources": []
         }}
-        """
-        prompt = ChatPromptTemplate.from_template(prompt_template)
-        chain = prompt | llm | StrOutputParser()
-        try:
-            raw_output = chain.invoke({"question": message})
-            # Try to parse JSON object out of output
-            match = re.search(r"\{[\s\S]*\}", raw_output)
-            if match:
-                try:
-                    return json.loads(match.group(0))
-                except Exception:
-                    return {"answer": raw_output, "sources": []}
-            else:
-                return {"answer": raw_output, "sources": []}
-        except Exception as e:
-            print(f"⚠️ Fallback LLM failed: {e}")
-            return {
-                "answer": "I couldn't find any research on that, and I had trouble generating a general answer.",
-                "sources": []
-            }
+        """)
 
-    # 2. Compress the retrieved chunks into a short context
-    short_context = compress_context(chunks)
-
-    # 3. Generate the final answer grounded on the retrieved context
-    prompt_template = """
+RAG_PROMPT = ChatPromptTemplate.from_template("""
     You are ResearchGPT, a grounded research assistant.
     Use ONLY the provided research context to answer the user's question.
 
@@ -142,44 +192,25 @@ def generate_rag_response(uid: str, message: str, context_ids: Optional[List[str
         {{ "title": "...", "doc_id": "...", "chunk_type": "..." }}
       ]
     }}
-    """
+    """)
 
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    chain = prompt | llm | StrOutputParser()
 
-    try:
-        raw_output = chain.invoke({"context": short_context, "question": message})
-
-        # Extract JSON object from model output if possible
-        match = re.search(r"\{[\s\S]*\}", raw_output)
-        if match:
-            try:
-                result = json.loads(match.group(0))
-            except Exception:
-                # If the JSON parsing fails, keep raw_output as answer
-                result = {"answer": raw_output, "sources": []}
-        else:
-            result = {"answer": raw_output, "sources": []}
+def _parse_answer(raw_output: str):
+    """Extract the JSON object from model output, else wrap the raw text as the answer."""
+    match = re.search(r"\{[\s\S]*\}", raw_output)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except Exception:
+            # If the JSON parsing fails, keep raw_output as answer
+            return {"answer": raw_output, "sources": []}
+    return {"answer": raw_output, "sources": []}
 
-    except Exception as e:
-        print(f"⚠️ Answer generation failed: {e}")
-        result = {"answer": "Sorry, I encountered an error generating the answer.", "sources": []}
 
+def _finish_answer(result: dict, chunks: List[dict]) -> dict:
     # If model didn't provide sources, construct fallback sources from chunks
     if not result.get("sources"):
-        unique_sources = {}
-        for c in chunks:
-            meta = c.get("metadata", {}) or {}
-            doc_id = meta.get("doc_id") or meta.get("id") or meta.get("document_id")
-            key = f"{doc_id}_{meta.get('chunk_type')}"
-            if doc_id and key not in unique_sources:
-                unique_sources[key] = {
-                    "title": meta.get("title", "Unknown"),
-                    "doc_id": doc_id,
-                    "chunk_type": meta.get("chunk_type", "generic"),
-                    "section": meta.get("section", "General")
-                }
-        result["sources"] = list(unique_sources.values())[:10]
+        result["sources"] = sources_from_chunks(chunks)
 
     # Ensure result has required keys
     if "answer" not in result:
@@ -188,3 +219,128 @@ def generate_rag_response(uid: str, message: str, context_ids: Optional[List[str
         result["sources"] = []
 
     return result
+
+
+def _cached_answer(uid: str, message: str, context_ids: Optional[List[str]]):
+    """(query_embedding, cached answer or None); (None, None) if the lookup fails."""
+    try:
+        query_embedding = vector_store.embed_query(message)
+        return query_embedding, answer_cache.lookup(uid, query_embedding, context_ids)
+    except Exception as e:
+        logger.warning(f"⚠️ Answer cache lookup failed: {e}")
+        return None, None
+
+
+def _store_answer(uid: str, query_embedding, context_ids: Optional[List[str]], result: dict):
+    cacheable = isinstance(result, dict) and result.get("answer") not in (FALLBACK_ERROR_ANSWER, GENERATION_ERROR_ANSWER)
+    if query_embedding is not None and cacheable:
+        source_doc_ids = [s.get("doc_id") for s in result.get("sources") or [] if isinstance(s, dict)]
+        answer_cache.store(uid, query_embedding, context_ids, result, doc_ids=source_doc_ids)
+
+
+def _retrieve_or_empty(uid: str, message: str, context_ids: Optional[List[str]]) -> List[dict]:
+    try:
+        logger.info(f"🤖 RAG Chat: '{message}' (uid={uid}, context_ids={context_ids})")
+
+        # 1. Retrieve (user-scoped)
+        return retrieve_chunks(uid, message, context_ids)
+    except Exception as e:
+        logger.warning(f"⚠️ Retrieval failed: {e}")
+        return []
+
+
+async def agenerate_rag_response(uid: str, message: str, context_ids: Optional[List[str]] = None) -> dict:
+    """
+    Full RAG pipeline for the /chat_rag handler: Retrieve -> Compress -> Generate.
+    Near-identical questions over the same context_ids are answered from the
+    semantic answer cache. Embedding, retrieval and cache writes run in worker
+    threads; LLM calls are awaited through the async concurrency limit, so a
+    waiting request holds no thread.
+    Returns a dict: {"answer": str, "sources": [ {title, doc_id, chunk_type, section?}, ... ] }
+    Raises LLMBusy when too many LLM calls are already queued.
+    """
+    query_embedding, cached = await asyncio.to_thread(_cached_answer, uid, message, context_ids)
+    if cached is not None:
+        logger.info(f"⚡ Answer cache hit: '{message}' (uid={uid})")
+        return cached
+
+    chunks = await asyncio.to_thread(_retrieve_or_empty, uid, message, context_ids)
+
+    if not chunks:
+        logger.warning("⚠️ No relevant chunks found. Falling back to general LLM.")
+        chain = FALLBACK_PROMPT | llm | StrOutputParser()
+        try:
+            result = _parse_answer(await ainvoke(chain, {"question": message}, "chat_fallback"))
+        except LLMBusy:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Fallback LLM failed: {e}")
+            result = {"answer": FALLBACK_ERROR_ANSWER, "sources": []}
+    else:
+        short_context = await acompress_context(chunks, message)
+        chain = RAG_PROMPT | llm | StrOutputParser()
+        try:
+            raw_output = await ainvoke(chain, {"context": short_context, "question": message}, "chat_rag")
+            result = _parse_answer(raw_output)
+        except LLMBusy:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Answer generation failed: {e}")
+            result = {"answer": GENERATION_ERROR_ANSWER, "sources": []}
+        result = _finish_answer(result, chunks)
+
+    await asyncio.to_thread(_store_answer, uid, query_embedding, context_ids, result)
+    return result
+
+
+def stream_rag_response(uid: str, message: str, context_ids: Optional[List[str]] = None) -> Iterator[dict]:
+    """
+    Streaming variant of agenerate_rag_response.
+    Yields {"type": "token", "content": str} as the model generates plain-text
+    answer tokens, then {"type": "sources", "sources": [...]} built from the
+    retrieved chunks' metadata, then {"type": "done"}.
+    """
+    try:
+        logger.info(f"🤖 RAG Chat (stream): '{message}' (uid={uid}, context_ids={context_ids})")
+        chunks = retrieve_chunks(uid, message, context_ids)
+    except Exception as e:
+        logger.warning(f"⚠️ Retrieval failed: {e}")
+        chunks = []
+
+    if chunks:
+        prompt_template = """
+        You are ResearchGPT, a grounded research assistant.
+        Use ONLY the provided research context to answer the user's question.
+
+        RESEARCH CONTEXT:
+        {context}
+
+        USER QUESTION:
+        {question}
+
+        Answer with a clear, accurate explanation, citing relevant paper titles.
+        Do NOT hallucinate missing information. Answer in plain text, not JSON.
+        """
+        inputs = {"context": compress_context(chunks, message), "question": message}
+    else:
+        logger.warning("⚠️ No relevant chunks found. Falling back to general LLM.")
+        prompt_template = """
+        You are a helpful research assistant.
+        The user asked: "{question}"
+
+        Answer based on your general knowledge, in plain text.
+        """
+        inputs = {"question": message}
+
+    prompt_type = "chat_rag_stream" if chunks else "chat_fallback_stream"
+    chain = ChatPromptTemplate.from_template(prompt_template) | llm | StrOutputParser()
+    try:
+        for token in chain.stream(inputs, config=prompt_config(prompt_type)):
+            if token:
+                yield {"type": "token", "content": token}
+    except Exception as e:
+        logger.warning(f"⚠️ Streaming answer generation failed: {e}")
+        yield {"type": "error", "error": GENERATION_ERROR_ANSWER}
+
+    yield {"type": "sources", "sources": sources_from_chunks(chunks)}
+    yield {"type": "done"}
@@ -0,0 +1,87 @@
+"""
+Extractive, token-budgeted context packing for RAG prompts.
+
+Replaces the LLM compression call: every sentence of the retrieved chunks is
+scored against the query, using the chunk's stored embedding similarity plus
+IDF-weighted query-term overlap, and the best sentences are packed greedily
+until the token budget is reached. Output keeps per-source attribution and
+the original sentence order within each source. Pure CPU, no model calls.
+"""
+import math
+import re
+
+import numpy as np
+
+from lexical_index import tokenize
+
+CHARS_PER_TOKEN = 4
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[])")
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in SENTENCE_RE.split(text or "") if s.strip()]
+
+
+def _chunk_relevance(query_embedding, chunks: list) -> list:
+    """Cosine similarity of each chunk's stored embedding to the query (0.0 if missing)."""
+    if query_embedding is None:
+        return [0.0] * len(chunks)
+    q = np.asarray(query_embedding, dtype=np.float32)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    scores = []
+    for c in chunks:
+        emb = c.get("embedding")
+        if emb is None:
+            scores.append(0.0)
+            continue
+        e = np.asarray(emb, dtype=np.float32)
+        scores.append(float(e @ q) / max(float(np.linalg.norm(e)), 1e-12))
+    return scores
+
+
+def pack_context(chunks: list, query: str, query_embedding=None, token_budget: int = 1000,
+                 chunk_weight: float = 0.5) -> str:
+    """Greedy extractive packing of the most query-relevant sentences within token_budget."""
+    query_terms = set(tokenize(query))
+    relevance = _chunk_relevance(query_embedding, chunks)
+
+    sentences = []  # (chunk_idx, sentence_idx, text, terms)
+    for ci, c in enumerate(chunks):
+        content = c.get("content", "") or c.get("document", "") or ""
+        for si, sent in enumerate(split_sentences(content)):
+            sentences.append((ci, si, sent, set(tokenize(sent))))
+    if not sentences:
+        return ""
+
+    # IDF of query terms over the retrieved sentences only
+    n = len(sentences)
+    idf = {t: math.log(1 + n / (1 + sum(t in s[3] for s in sentences))) for t in query_terms}
+    max_overlap = sum(idf.values()) or 1.0
+
+    scored = []
+    for ci, si, sent, terms in sentences:
+        overlap = sum(idf[t] for t in query_terms & terms) / max_overlap
+        score = chunk_weight * relevance[ci] + (1 - chunk_weight) * overlap
+        # Slight preference for a chunk's leading sentences, which usually carry the claim
+        scored.append((score - 0.01 * si, ci, si, sent))
+    scored.sort(key=lambda x: x[0], reverse=True)
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    used = 0
+    picked = {}
+    for _, ci, si, sent in scored:
+        cost = len(sent) + 1
+        if used + cost > budget_chars:
+            continue
+        picked.setdefault(ci, []).append((si, sent))
+        used += cost
+
+    parts = []
+    for ci in sorted(picked, key=lambda i: -relevance[i]):
+        meta = chunks[ci].get("metadata", {}) or {}
+        title = meta.get("title", "Unknown")
+        doc_id = meta.get("doc_id", "N/A")
+        type_ = meta.get("chunk_type", "fragment")
+        body = " ".join(sent for _, sent in sorted(picked[ci]))
+        parts.append(f"--- Source: {title} (ID: {doc_id}, Type: {type_}) ---\n{body}\n")
+    return "\n".join(parts)
@@ -0,0 +1,84 @@
+"""
+Streaming PDF downloader on a shared, pooled HTTP session.
+
+Responses are written to disk in fixed-size chunks (never held in memory as a
+whole), capped at MAX_PDF_MB, and SHA-256 hashed while streaming.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+MAX_PDF_MB = float(os.getenv("MAX_PDF_MB", "100"))
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+
+_session = None
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide session so downloads reuse TCP/TLS connections."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(16, DOWNLOAD_CONCURRENCY * 2))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+class DownloadTooLarge(Exception):
+    """Raised when a response exceeds the configured maximum size."""
+
+
+def fetch_pdf(pdf_url: str, max_bytes: int = int(MAX_PDF_MB * 1024 * 1024), dest_path: str = None):
+    """
+    Stream pdf_url to dest_path (or a new temp file).
+    Returns {"path", "sha256", "size"} or None if the download failed or the
+    response doesn't look like a PDF. On failure only a temp file this function
+    created is removed; cleaning up dest_path is left to the caller.
+    """
+    path = dest_path
+    created = False
+    try:
+        with get_http_session().get(pdf_url, timeout=30, allow_redirects=True, stream=True) as resp:
+            if resp.status_code != 200:
+                raise requests.HTTPError(f"HTTP {resp.status_code}")
+
+            declared = int(resp.headers.get("content-length") or 0)
+            if declared > max_bytes:
+                raise DownloadTooLarge(f"{declared} bytes exceeds limit of {max_bytes}")
+
+            if path is None:
+                fd, path = tempfile.mkstemp(suffix=".pdf")
+                os.close(fd)
+                created = True
+
+            digest = hashlib.sha256()
+            size = 0
+            with open(path, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadTooLarge(f"response exceeds limit of {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            # accept any 200 content but check extension or content-type if available
+            content_type = resp.headers.get("content-type", "")
+            if 'pdf' in content_type.lower() or pdf_url.lower().endswith('.pdf') or size > 100:
+                return {"path": path, "sha256": digest.hexdigest(), "size": size}
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to download PDF: {e}")
+
+    if created and os.path.exists(path):
+        os.unlink(path)
+    return None
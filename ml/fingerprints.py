@@ -0,0 +1,84 @@
+"""
+Content fingerprints for analyzed papers.
+
+Each stored paper is recorded under two hashes: SHA-256 of the PDF bytes and
+SHA-256 of its normalized extracted text (which also matches re-encoded copies
+of the same paper). process_analysis checks them before running the pipeline
+so a known document is returned or re-linked instead of recomputed.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+FINGERPRINT_DB_PATH = os.getenv("FINGERPRINT_DB_PATH", "./fingerprints.db")
+
+
+def file_sha256(path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    """Hash of lowercased, whitespace-collapsed text."""
+    normalized = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class FingerprintIndex:
+    """SQLite map of content/text hashes -> (uid, doc_id) of the stored paper."""
+
+    def __init__(self, path: str = FINGERPRINT_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                kind    TEXT NOT NULL,
+                digest  TEXT NOT NULL,
+                uid     TEXT NOT NULL,
+                doc_id  TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (kind, digest, uid)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_doc ON fingerprints(uid, doc_id)")
+        self._conn.commit()
+
+    def record(self, uid: str, doc_id: str, content_sha256: str = None, text_sha256: str = None):
+        now = time.time()
+        with self._lock:
+            for kind, digest in (("content", content_sha256), ("text", text_sha256)):
+                if digest:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO fingerprints (kind, digest, uid, doc_id, created) VALUES (?, ?, ?, ?, ?)",
+                        (kind, digest, uid, doc_id, now)
+                    )
+            self._conn.commit()
+
+    def lookup(self, kind: str, digest: str, uid: str = None) -> list:
+        """
+        [(uid, doc_id)] for a hash. The requesting user's own copy comes first
+        so it is preferred over re-linking another user's paper.
+        """
+        if not digest:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT uid, doc_id FROM fingerprints WHERE kind = ? AND digest = ? ORDER BY created DESC",
+                (kind, digest)
+            ).fetchall()
+        return sorted(rows, key=lambda r: r[0] != uid)
+
+    def forget(self, uid: str, doc_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM fingerprints WHERE uid = ? AND doc_id = ?", (uid, doc_id))
+            self._conn.commit()
+
+
+fingerprint_index = FingerprintIndex()
@@ -1,15 +1,16 @@
 from fastapi import FastAPI, Request
-from langchain_ollama import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import json, re
+import logging
+from model_registry import get_llm
+from metrics import prompt_config
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-llm = OllamaLLM(
-    model="llama3:8b",
-    base_url="http://100.74.147.124:11434"
-)
+llm = get_llm()
 
 prompt = ChatPromptTemplate.from_template("""
 You are an expert AI research analyst.  
@@ -38,7 +39,7 @@ def safe_json_parse(text: str):
         try:
             return json.loads(match.group(0))
         except json.JSONDecodeError:
-            print("Could not cleanly parse JSON, returning raw text.")
+            logger.info("Could not cleanly parse JSON, returning raw text.")
             return {"raw_output": match.group(0)}
     else:
         return {"raw_output": text.strip()}
@@ -51,8 +52,8 @@ async def insight_from_summary(request: Request):
     if not summary:
         return {"error": "Missing summary data"}
 
-    print("Generating insights...")
-    raw_output = chain.invoke({"summary": str(summary)})
+    logger.info("Generating insights...")
+    raw_output = chain.invoke({"summary": str(summary)}, config=prompt_config("insights"))
     insights = safe_json_parse(raw_output)
 
     return insights
@@ -0,0 +1,249 @@
+"""
+Bounded worker-pool scheduler for analysis jobs, backed by a persistent job table.
+
+JobTable keeps live job dicts in memory (process_analysis mutates them in place
+for progress) and writes them to SQLite on every assignment or save(), so
+status survives restarts. Finished jobs expire after JOB_TTL_HOURS.
+
+Every change to a live job (including in-place progress updates) is pushed to
+asyncio subscribers registered with JobTable.subscribe(), which backs the
+server-sent-events progress stream.
+
+JobScheduler runs jobs on a fixed number of worker threads fed by a bounded
+FIFO queue; submit() raises QueueFull when the queue is at capacity so the
+API can push back instead of overloading Ollama.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "./jobs.db")
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", "24"))
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "32"))
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class QueueFull(Exception):
+    """Raised when the scheduler's queue has no free slot."""
+
+
+class JobState(dict):
+    """Job dict that notifies its JobTable whenever a field changes."""
+
+    def __init__(self, data: dict, on_change):
+        super().__init__(data)
+        self._on_change = on_change
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._on_change()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._on_change()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._on_change()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._on_change()
+        return value
+
+
+class JobTable:
+    """Dict-like job store: in-memory live state, persisted to SQLite."""
+
+    def __init__(self, path: str = JOB_DB_PATH, ttl_hours: float = JOB_TTL_HOURS):
+        self.ttl_seconds = ttl_hours * 3600
+        self._jobs = {}
+        self._subscribers = {}  # job_id -> [(event loop, asyncio.Queue)]
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id  TEXT PRIMARY KEY,
+                status  TEXT NOT NULL,
+                state   TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs(status, updated)")
+        # Jobs that were running when the process died cannot resume (temp PDFs are gone)
+        for job_id, state in self._conn.execute(
+            "SELECT job_id, state FROM jobs WHERE status NOT IN (?, ?)", FINISHED_STATUSES
+        ).fetchall():
+            job = json.loads(state)
+            job.update({"status": "failed", "error": "Interrupted by service restart"})
+            self._write(job_id, job)
+        self._conn.commit()
+
+    def _write(self, job_id: str, job: dict):
+        now = time.time()
+        self._conn.execute(
+            """INSERT INTO jobs (job_id, status, state, created, updated) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(job_id) DO UPDATE SET status = excluded.status,
+                                                 state = excluded.state,
+                                                 updated = excluded.updated""",
+            (job_id, job.get("status", "unknown"), json.dumps(job, default=str), now, now)
+        )
+
+    def __setitem__(self, job_id: str, job: dict):
+        job = JobState(job, lambda: self._notify(job_id))
+        with self._lock:
+            self._jobs[job_id] = job
+            self._write(job_id, job)
+            self._conn.commit()
+        self._notify(job_id)
+
+    def subscribe(self, job_id: str):
+        """
+        Register an asyncio.Queue (on the running loop) that receives a snapshot
+        of the job after every change. Must be called from the event loop.
+        """
+        import asyncio
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(job_id, []).append(entry)
+        return entry[1]
+
+    def unsubscribe(self, job_id: str, q):
+        with self._lock:
+            subs = [e for e in self._subscribers.get(job_id, []) if e[1] is not q]
+            if subs:
+                self._subscribers[job_id] = subs
+            else:
+                self._subscribers.pop(job_id, None)
+
+    def _notify(self, job_id: str):
+        with self._lock:
+            subs = list(self._subscribers.get(job_id, ()))
+            job = self._jobs.get(job_id)
+        if not subs or job is None:
+            return
+        snapshot = dict(job)
+        for loop, q in subs:
+            try:
+                loop.call_soon_threadsafe(q.put_nowait, snapshot)
+            except RuntimeError:
+                pass  # subscriber's loop already closed
+
+    def __getitem__(self, job_id: str) -> dict:
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def get(self, job_id: str, default=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job
+            row = self._conn.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def save(self, job_id: str):
+        """Persist in-place changes made to a live job dict."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._write(job_id, job)
+                self._conn.commit()
+
+    def cleanup(self) -> int:
+        """Drop finished jobs older than the TTL from memory and disk."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [r[0] for r in self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (*FINISHED_STATUSES, cutoff)
+            ).fetchall()]
+            for job_id in expired:
+                self._jobs.pop(job_id, None)
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (*FINISHED_STATUSES, cutoff)
+            )
+            self._conn.commit()
+            # Finished jobs stay readable from SQLite; only live ones need memory.
+            # Write first: in-place changes may not have been save()d yet.
+            for job_id in [j for j, job in self._jobs.items() if job.get("status") in FINISHED_STATUSES]:
+                self._write(job_id, self._jobs.pop(job_id))
+            self._conn.commit()
+        return len(expired)
+
+
+class JobScheduler:
+    """Fixed-size worker pool consuming a bounded FIFO queue of jobs."""
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS, max_queue: int = ANALYSIS_QUEUE_SIZE):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._order = deque()
+        self._order_lock = threading.Lock()
+        self._threads = []
+        self._started = False
+
+    def _ensure_started(self):
+        with self._order_lock:
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"analysis-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            job_id, func, args = self._queue.get()
+            with self._order_lock:
+                try:
+                    self._order.remove(job_id)
+                except ValueError:
+                    pass
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"❌ Scheduled job {job_id} raised: {e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, job_id: str, func, *args):
+        """Queue func(*args); raises QueueFull if no slot is free."""
+        self._ensure_started()
+        with self._order_lock:
+            try:
+                self._queue.put_nowait((job_id, func, args))
+            except queue.Full:
+                raise QueueFull(f"Analysis queue is full ({self._queue.maxsize} jobs waiting)")
+            self._order.append(job_id)
+        return self.queue_position(job_id)
+
+    def queue_position(self, job_id: str):
+        """1-based position among waiting jobs, or None if not waiting."""
+        with self._order_lock:
+            try:
+                return self._order.index(job_id) + 1
+            except ValueError:
+                return None
+
+    def stats(self) -> dict:
+        with self._order_lock:
+            queued = len(self._order)
+        return {"workers": self.workers, "queued": queued, "max_queue": self._queue.maxsize}
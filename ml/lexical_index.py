@@ -0,0 +1,108 @@
+"""
+Per-user BM25 inverted index over enriched chunks.
+
+Dense MiniLM retrieval misses exact tokens (dataset names, model acronyms,
+symbols); this index catches them. VectorStore keeps it in sync incrementally
+and fuses its ranking with Chroma's via reciprocal rank fusion.
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+# Keeps hyphenated/dotted identifiers together: "gpt-4", "resnet-50", "f1.5"
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+class BM25Index:
+    """Incremental BM25 (Okapi) index of chunk_id -> text, grouped by doc_id."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)   # term -> {chunk_id: tf}
+        self._doc_len = {}                   # chunk_id -> token count
+        self._chunk_terms = {}               # chunk_id -> distinct terms
+        self._chunk_doc = {}                 # chunk_id -> doc_id
+        self._doc_chunks = defaultdict(set)  # doc_id -> chunk_ids
+        self._total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, chunk_id: str, text: str, doc_id: str = None):
+        tokens = tokenize(text)
+        tf = Counter(tokens)
+        with self._lock:
+            if chunk_id in self._doc_len:
+                self.remove_chunk(chunk_id)
+            for term, count in tf.items():
+                self._postings[term][chunk_id] = count
+            self._doc_len[chunk_id] = len(tokens)
+            self._chunk_terms[chunk_id] = tuple(tf)
+            self._total_len += len(tokens)
+            if doc_id:
+                self._chunk_doc[chunk_id] = doc_id
+                self._doc_chunks[doc_id].add(chunk_id)
+
+    def remove_chunk(self, chunk_id: str):
+        with self._lock:
+            if chunk_id not in self._doc_len:
+                return
+            for term in self._chunk_terms.pop(chunk_id, ()):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_len -= self._doc_len.pop(chunk_id)
+            doc_id = self._chunk_doc.pop(chunk_id, None)
+            if doc_id is not None:
+                self._doc_chunks[doc_id].discard(chunk_id)
+                if not self._doc_chunks[doc_id]:
+                    del self._doc_chunks[doc_id]
+
+    def remove_doc(self, doc_id: str):
+        with self._lock:
+            for chunk_id in list(self._doc_chunks.get(doc_id, ())):
+                self.remove_chunk(chunk_id)
+
+    def search(self, query: str, k: int = 10, doc_ids: list = None) -> list:
+        """Top-k [(chunk_id, score)], optionally restricted to chunks of doc_ids."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._doc_len)
+            if not n or not terms:
+                return []
+            allowed = None
+            if doc_ids:
+                allowed = set()
+                for d in doc_ids:
+                    allowed |= self._doc_chunks.get(d, set())
+            avg_len = self._total_len / n
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    if allowed is not None and chunk_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[chunk_id] / avg_len)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """Fuse several ranked id lists; returns [(id, score)] best first."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            fused[item_id] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,297 @@
+"""
+In-process timing spans and Prometheus-style metrics.
+
+span(stage, op) times a block of work (PDF extraction, embedding, Chroma
+operations) into a labelled histogram and logs it at DEBUG level; LLM calls
+are timed by LLMMetricsCallback, attached to the shared OllamaLLM, and tagged
+by prompt type. render() produces the Prometheus text exposition format served
+on GET /metrics.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    Settable gauge; pass `func` to compute the value at scrape time instead.
+    func returns a number, or {label values tuple: number} for a labelled gauge.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), func=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._func = func
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list:
+        if self._func is not None:
+            try:
+                value = self._func()
+                if isinstance(value, dict):
+                    with self._lock:
+                        self._values = {tuple(k): float(v) for k, v in value.items()}
+                else:
+                    self.set(float(value))
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} callback failed: {e}")
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = (), func=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, func=func))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "autoresearch_stage_duration_seconds",
+    "Wall time of instrumented pipeline operations.",
+    ("stage", "op"),
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "autoresearch_stage_errors_total",
+    "Instrumented operations that raised.",
+    ("stage", "op"),
+)
+EMBEDDED_TEXTS = REGISTRY.counter(
+    "autoresearch_embedded_texts_total",
+    "Texts encoded by the embedding model.",
+    ("op",),
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "autoresearch_llm_call_duration_seconds",
+    "Wall time of LLM calls that reached Ollama (cache hits excluded).",
+    ("prompt_type",),
+)
+LLM_CALLS = REGISTRY.counter(
+    "autoresearch_llm_calls_total",
+    "LLM calls that reached Ollama, by prompt type and outcome.",
+    ("prompt_type", "status"),
+)
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    "autoresearch_llm_in_flight",
+    "LLM calls currently waiting on Ollama.",
+)
+LLM_IN_FLIGHT.set(0)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+@contextmanager
+def span(stage: str, op: str = "", **fields):
+    """
+    Time the enclosed block under (stage, op). Extra keyword fields are only
+    logged, never used as metric labels, so they may be high-cardinality.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        STAGE_ERRORS.inc(stage=stage, op=op)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage, op=op)
+        if logger.isEnabledFor(logging.DEBUG):
+            extra = " ".join(f"{k}={v}" for k, v in fields.items())
+            logger.debug(f"span stage={stage} op={op} seconds={elapsed:.4f} failed={failed} {extra}".rstrip())
+
+
+def prompt_config(prompt_type: str) -> dict:
+    """Runnable config tagging an LLM call with its prompt type for LLMMetricsCallback."""
+    return {"tags": [f"prompt:{prompt_type}"], "metadata": {"prompt_type": prompt_type}}
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Times every LLM run and tracks how many are in flight."""
+
+    # Cheap and lock-protected, so async runs call it on the loop instead of via an executor
+    run_inline = True
+
+    def __init__(self):
+        self._runs = {}  # run_id -> (prompt_type, start)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prompt_type(tags, metadata) -> str:
+        if metadata and metadata.get("prompt_type"):
+            return str(metadata["prompt_type"])
+        for tag in tags or ():
+            if tag.startswith("prompt:"):
+                return tag[len("prompt:"):]
+        return "untagged"
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, metadata=None, **kwargs):
+        with self._lock:
+            self._runs[run_id] = (self._prompt_type(tags, metadata), time.perf_counter())
+        LLM_IN_FLIGHT.inc()
+
+    def _finish(self, run_id, status: str):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        prompt_type, start = run
+        elapsed = time.perf_counter() - start
+        LLM_IN_FLIGHT.dec()
+        LLM_SECONDS.observe(elapsed, prompt_type=prompt_type)
+        LLM_CALLS.inc(prompt_type=prompt_type, status=status)
+        logger.debug(f"span stage=llm op={prompt_type} seconds={elapsed:.4f} failed={status != 'ok'}")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, "ok")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+
+class InstrumentedCollection:
+    """Proxy around a Chroma collection that times its data operations."""
+
+    TIMED_METHODS = frozenset({"add", "upsert", "update", "query", "get", "delete", "count", "peek"})
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in self.TIMED_METHODS or not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            with span("chroma", name, collection=self._collection.name):
+                return attr(*args, **kwargs)
+
+        return timed
@@ -0,0 +1,272 @@
+"""
+Process-wide registry for heavy shared resources.
+
+The embedding model, the Chroma client and the Ollama LLM handle are created
+once per process, lazily on first use (or eagerly through warmup()), and shared
+by app.py, chat_agent.py, summarizer_agent.py and vector_store.py.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+import chromadb
+import httpx
+from sentence_transformers import SentenceTransformer
+from langchain_ollama import OllamaLLM
+
+from llm_cache import install_llm_cache
+from metrics import LLMMetricsCallback, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL", "llama3:8b")
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://100.74.147.124:11434")
+# Max LLM calls in flight to Ollama across the whole process; match the server's OLLAMA_NUM_PARALLEL
+LLM_CONCURRENCY = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+# Async handlers: how many LLM calls may queue for a slot before requests get a 503
+LLM_ASYNC_MAX_WAITING = int(os.getenv("LLM_ASYNC_MAX_WAITING", "500"))
+
+_lock = threading.Lock()
+_embedding_model = None
+_chroma_client = None
+_llm = None
+
+# name -> {"load_seconds": float, "rss_delta_mb": float}
+_load_stats = {}
+
+class FairSlots:
+    """
+    Counting semaphore that hands out slots strictly in arrival order, to
+    threads and coroutines alike. A freed slot goes straight to the oldest
+    waiter, so a thread that releases and immediately re-acquires can't
+    overtake callers that were already queued.
+    """
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters = deque()  # threading.Event or (loop, future)
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                self.in_use += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                self.in_use += 1
+                return
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            # Granted, but the task was cancelled before it resumed: pass the slot on
+            if not queued and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def _grant_async(self, future):
+        # Runs on the waiter's loop; a waiter cancelled in the meantime passes the slot on
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                self.in_use -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(self._grant_async, future)
+        except RuntimeError:
+            self.release()  # waiter's loop is closed
+
+
+# One budget for every caller: scheduler jobs, batch workers, bounded_map pools
+# and async handlers all take a slot here, so thread pools only size threads.
+_llm_slots = FairSlots(LLM_CONCURRENCY)
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the process-wide LLM_CONCURRENCY slots (blocking)."""
+    _llm_slots.acquire()
+    try:
+        yield
+    finally:
+        _llm_slots.release()
+
+
+@asynccontextmanager
+async def allm_slot():
+    """llm_slot() for coroutines: queues in the same FIFO as threads without blocking the loop."""
+    await _llm_slots.aacquire()
+    try:
+        yield
+    finally:
+        _llm_slots.release()
+
+
+REGISTRY.gauge(
+    "autoresearch_llm_slots_in_use",
+    "Process-wide LLM slots (OLLAMA_NUM_PARALLEL) currently held by calls to Ollama.",
+    func=lambda: _llm_slots.in_use,
+)
+
+
+class BoundedOllamaLLM(OllamaLLM):
+    """
+    OllamaLLM whose requests to Ollama hold an LLM slot. Cache hits never
+    reach _generate/_stream, so they don't take one.
+    """
+
+    def _generate(self, *args, **kwargs):
+        with llm_slot():
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        with llm_slot():
+            yield from super()._stream(*args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        async with allm_slot():
+            return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with allm_slot():
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (0.0 if it cannot be read)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return 0.0
+
+
+def _timed_load(name: str, factory):
+    """Run factory(), recording wall time and RSS growth under `name`."""
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    obj = factory()
+    elapsed = time.perf_counter() - start
+    _load_stats[name] = {
+        "load_seconds": round(elapsed, 3),
+        "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+    }
+    logger.info(f"📦 Loaded {name} in {elapsed:.2f}s (RSS now {current_rss_mb():.0f} MB)")
+    return obj
+
+
+def get_embedding_model() -> SentenceTransformer:
+    """Shared SentenceTransformer, loaded on first call."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _lock:
+            if _embedding_model is None:
+                _embedding_model = _timed_load(
+                    "embedding_model",
+                    lambda: SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+                )
+    return _embedding_model
+
+
+def get_chroma_client():
+    """Shared Chroma PersistentClient, opened on first call."""
+    global _chroma_client
+    if _chroma_client is None:
+        with _lock:
+            if _chroma_client is None:
+                _chroma_client = _timed_load(
+                    "chroma_client",
+                    lambda: chromadb.PersistentClient(path=CHROMA_PATH)
+                )
+    return _chroma_client
+
+
+def get_llm() -> OllamaLLM:
+    """
+    Shared Ollama LLM handle. Completions go through the persistent LLM cache;
+    calls that reach Ollama hold an LLM slot and are timed by
+    LLMMetricsCallback. ainvoke() calls share one keep-alive connection pool
+    sized to LLM_CONCURRENCY.
+    """
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                install_llm_cache()
+                _llm = BoundedOllamaLLM(
+                    model=LLM_MODEL_NAME,
+                    base_url=OLLAMA_API_URL,
+                    callbacks=[LLMMetricsCallback()],
+                    async_client_kwargs={"limits": httpx.Limits(
+                        max_connections=LLM_CONCURRENCY,
+                        max_keepalive_connections=LLM_CONCURRENCY,
+                    )},
+                )
+    return _llm
+
+
+def warmup() -> dict:
+    """Eagerly load every shared resource and return resource_stats()."""
+    get_chroma_client()
+    model = get_embedding_model()
+    # First encode pays for lazy kernel/tokenizer initialisation
+    model.encode("warmup")
+    get_llm()
+    return resource_stats()
+
+
+def resource_stats() -> dict:
+    """Load times, RSS growth per resource and the current process RSS."""
+    return {
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "loaded": {
+            "embedding_model": _embedding_model is not None,
+            "chroma_client": _chroma_client is not None,
+            "llm": _llm is not None,
+        },
+        "loads": dict(_load_stats),
+        "rss_mb": round(current_rss_mb(), 1),
+    }
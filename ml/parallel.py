@@ -0,0 +1,122 @@
+"""
+Small helpers for running LLM-bound work concurrently. Pools here only size
+their threads; the number of calls in flight to Ollama is capped process-wide
+by the shared LLM (model_registry.llm_slot), however many pools are nested.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from model_registry import LLM_CONCURRENCY
+
+
+def bounded_map(func, items, max_workers: int = None, on_result=None) -> list:
+    """
+    Apply func to every item on at most max_workers threads (default
+    LLM_CONCURRENCY; the LLM calls themselves queue for shared slots).
+
+    Results are returned in input order even though they finish out of order.
+    on_result(index, result, completed_count) is called from the caller's
+    thread as each item finishes, which makes it safe for progress reporting.
+    The first exception raised by func is re-raised after in-flight work ends.
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(max_workers or LLM_CONCURRENCY, len(items)))
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, item): i for i, item in enumerate(items)}
+        for completed, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i] = future.result()
+            if on_result:
+                on_result(i, results[i], completed)
+    return results
+
+
+async def abounded_map(afunc, items, max_concurrency: int = None) -> list:
+    """
+    Async bounded_map: await afunc(item) for every item with at most
+    max_concurrency running, results in input order. The first exception
+    cancels the calls still running or waiting and is re-raised, so a failed
+    request doesn't keep using LLM slots.
+    """
+    items = list(items)
+    if not items:
+        return []
+    gate = asyncio.Semaphore(max(1, max_concurrency or LLM_CONCURRENCY))
+
+    async def _run(item):
+        async with gate:
+            return await afunc(item)
+
+    tasks = [asyncio.ensure_future(_run(item)) for item in items]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def run_task_graph(tasks: dict, max_workers: int = None, on_done=None) -> dict:
+    """
+    Execute a small dependency graph of tasks concurrently.
+
+    tasks maps name -> (func, [dependency names]); func receives a dict of its
+    dependencies' results. A task starts as soon as all its dependencies have
+    succeeded. Failures are isolated: a failed task records its error and only
+    its dependents are skipped. on_done(name, report) fires as each task ends.
+
+    Returns {name: {"status", "seconds", "result"/"error"}}.
+    """
+    for name, (_, deps) in tasks.items():
+        unknown = [d for d in deps if d not in tasks]
+        if unknown:
+            raise ValueError(f"Task '{name}' depends on unknown task(s): {unknown}")
+
+    reports = {}
+    pending = dict(tasks)
+    running = {}
+
+    def _timed(func, dep_results):
+        start = time.perf_counter()
+        try:
+            return "completed", func(dep_results), None, time.perf_counter() - start
+        except Exception as e:
+            return "failed", None, str(e), time.perf_counter() - start
+
+    def _finish(name, report):
+        reports[name] = report
+        if on_done:
+            on_done(name, report)
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(tasks))) as pool:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if any(reports.get(d, {}).get("status") in ("failed", "skipped") for d in deps):
+                    del pending[name]
+                    _finish(name, {"status": "skipped", "seconds": 0.0, "error": "dependency failed"})
+                elif all(d in reports for d in deps):
+                    del pending[name]
+                    dep_results = {d: reports[d]["result"] for d in deps}
+                    running[pool.submit(_timed, func, dep_results)] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Task graph has a cycle among: {list(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                status, result, error, seconds = future.result()
+                report = {"status": status, "seconds": round(seconds, 3)}
+                if status == "completed":
+                    report["result"] = result
+                else:
+                    report["error"] = error
+                _finish(name, report)
+    return reports
@@ -0,0 +1,195 @@
+"""
+Layout-aware section segmentation.
+
+Headings are detected from PyMuPDF span fonts instead of asking the LLM: a
+line is a heading when it is short, doesn't read like a sentence, and is set
+noticeably larger than the body text (or in bold and numbered / a known
+section name). Text between consecutive headings becomes one section, so the
+whole paper is covered, middle included. When the PDF is not available the
+same rules run on plain text using numbering and known section names only.
+"""
+import os
+import re
+from collections import Counter
+
+import fitz  # PyMuPDF
+
+from metrics import span
+
+# Longest section text sent in one summary prompt; longer sections are split into parts
+SECTION_MAX_CHARS = int(os.getenv("SECTION_MAX_CHARS", "8000"))
+# Sections shorter than this (e.g. a heading directly followed by a subheading) are folded into a neighbour
+SECTION_MIN_CHARS = 300
+# A line this much larger than the body font is a heading candidate
+HEADING_SIZE_RATIO = 1.12
+
+KNOWN_HEADING_RE = re.compile(
+    r"^(?:(?:\d+(?:\.\d+)*\.?|[IVX]+\.|[A-Z]\.)\s+)?"
+    r"(abstract|introduction|background|related work|preliminaries|method(?:s|ology)?|approach|"
+    r"model|experiments?|experimental (?:setup|results)|results?|evaluation|analysis|discussion|"
+    r"conclusions?|limitations|future work|acknowledge?ments|references|bibliography|appendix)\b",
+    re.IGNORECASE,
+)
+NUMBERED_HEADING_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.|[A-Z]\.)\s+[A-Z][^.!?]{1,80}$")
+CAPTION_RE = re.compile(r"^(?:fig(?:ure)?|table|algorithm|eq(?:uation)?)\.?\s*\d", re.IGNORECASE)
+# Not worth a summary call
+SKIP_SECTION_RE = re.compile(r"^(?:(?:\d+|[IVX]+)\.?\s+)?(references|bibliography|acknowledge?ments)\b", re.IGNORECASE)
+
+FRONT_MATTER = "Front Matter"
+
+
+def _looks_like_heading(text: str, size: float = None, bold: bool = False, body_size: float = None) -> bool:
+    words = text.split()
+    if not words or len(text) > 100 or len(words) > 14:
+        return False
+    if not re.search(r"[A-Za-z]{2}", text) or CAPTION_RE.match(text):
+        return False
+    # Only the bare section name counts as known, optionally numbered or with run-in
+    # punctuation ("Abstract.", "2 Related Work"); "model is trained on" does not
+    name = KNOWN_HEADING_RE.match(text)
+    known = name is not None and not text[0].islower() and not text[name.end():].strip(" .:")
+    if text[-1] in ".,;:" and not known:
+        return False
+    if size is not None and body_size:
+        if size >= body_size * HEADING_SIZE_RATIO:
+            return True
+        # Body-sized lines are headings only when bold and numbered / a known name
+        return bold and (known or NUMBERED_HEADING_RE.match(text) is not None)
+    # Without font information only numbered headings and known names qualify
+    return known or NUMBERED_HEADING_RE.match(text) is not None
+
+
+def _layout_lines(path: str):
+    """Yield (page_number, text, font_size, bold) for every non-empty text line."""
+    doc = fitz.open(path)
+    try:
+        for page in doc:
+            for block in page.get_text("dict")["blocks"]:
+                if block.get("type") != 0:
+                    continue
+                for line in block.get("lines", []):
+                    spans = [s for s in line.get("spans", []) if s.get("text", "").strip()]
+                    if not spans:
+                        continue
+                    text = " ".join(s["text"].strip() for s in spans)
+                    # Size that covers most characters of the line
+                    sizes = Counter()
+                    for s in spans:
+                        sizes[round(s["size"], 1)] += len(s["text"])
+                    bold = all(s.get("flags", 0) & 16 or "bold" in s.get("font", "").lower() for s in spans)
+                    yield page.number + 1, text, sizes.most_common(1)[0][0], bold
+    finally:
+        doc.close()
+
+
+def _join_lines(lines: list) -> str:
+    out = ""
+    for line in lines:
+        if out.endswith("-") and line[:1].islower():
+            out = out[:-1] + line
+        else:
+            out = f"{out} {line}" if out else line
+    return out
+
+
+def _group_sections(lines) -> list:
+    """lines: iterable of (page, text, is_heading) -> [{"section", "page", "lines"}]."""
+    sections = []
+    current = {"section": FRONT_MATTER, "page": 1, "lines": []}
+    for page, text, is_heading in lines:
+        if not is_heading:
+            current["lines"].append(text)
+            continue
+        if current["lines"]:
+            sections.append(current)
+            current = {"section": text, "page": page, "lines": []}
+        elif current["section"] == FRONT_MATTER:
+            current = {"section": text, "page": page, "lines": []}
+        else:
+            # Heading wrapped over several lines, or a number on its own line
+            current["section"] = f"{current['section']} {text}"
+    if current["lines"]:
+        sections.append(current)
+    return sections
+
+
+def _finalize(sections: list, max_chars: int) -> list:
+    """Join text, fold tiny sections into the next one, drop references, split oversized sections."""
+    merged = []
+    carry = None
+    for sec in sections:
+        text = _join_lines(sec["lines"])
+        if carry is not None:
+            text = f"{carry['section']}: {carry['text']} {text}".strip()
+            sec = {**sec, "page": carry["page"]}
+            carry = None
+        if len(text) < SECTION_MIN_CHARS:
+            carry = {"section": sec["section"], "page": sec["page"], "text": text}
+            continue
+        merged.append({"section": sec["section"], "page": sec["page"], "text": text})
+    if carry is not None:
+        if merged:
+            merged[-1]["text"] += f" {carry['section']}: {carry['text']}"
+        elif carry["text"]:
+            merged.append(carry)
+
+    result = []
+    for sec in merged:
+        if SKIP_SECTION_RE.match(sec["section"]):
+            continue
+        text = sec["text"]
+        if len(text) <= max_chars:
+            result.append(sec)
+            continue
+        parts = [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+        for n, part in enumerate(parts, 1):
+            result.append({"section": f"{sec['section']} (part {n}/{len(parts)})", "page": sec["page"], "text": part})
+    return result
+
+
+def segment_pdf(path: str, max_chars: int = SECTION_MAX_CHARS) -> list:
+    """[{"section", "page", "text"}] from font sizes and weights of the PDF's lines."""
+    with span("pdf_extraction", "segment_pdf", path=path):
+        lines = list(_layout_lines(path))
+    if not lines:
+        return []
+    sizes = Counter()
+    for _, text, size, _ in lines:
+        sizes[size] += len(text)
+    body_size = sizes.most_common(1)[0][0]
+    return _finalize(_group_sections(
+        (page, text, _looks_like_heading(text, size, bold, body_size))
+        for page, text, size, bold in lines
+    ), max_chars)
+
+
+def segment_text(full_text: str, max_chars: int = SECTION_MAX_CHARS) -> list:
+    """Plain-text fallback: numbered and well-known headings only; pages are unknown (None)."""
+    lines = [line.strip() for line in (full_text or "").splitlines() if line.strip()]
+    sections = _finalize(_group_sections(
+        (None, line, _looks_like_heading(line)) for line in lines
+    ), max_chars)
+    return sections
+
+
+def segment_sections(full_text: str, pdf_path: str = None, max_chars: int = SECTION_MAX_CHARS) -> list:
+    """
+    Layout segmentation when the PDF is on disk, else text segmentation.
+    If neither finds real headings the text is cut into fixed-size parts so
+    nothing is skipped.
+    """
+    sections = []
+    if pdf_path and os.path.exists(pdf_path):
+        try:
+            sections = segment_pdf(pdf_path, max_chars)
+        except Exception:
+            sections = []
+    if len(sections) < 2:
+        sections = segment_text(full_text, max_chars)
+    if len(sections) < 2 and full_text and full_text.strip():
+        text = full_text.strip()
+        sections = [
+            {"section": f"Part {n + 1}", "page": None, "text": text[i:i + max_chars]}
+            for n, i in enumerate(range(0, len(text), max_chars))
+        ]
+    return sections
@@ -0,0 +1,178 @@
+"""
+Local content-addressed PDF store.
+
+/fetch_papers can prefetch the listed PDFs in the background. Files are kept
+by SHA-256 (<root>/ab/abcdef….pdf) with a SQLite index from source URL to
+digest, so a later /analyze_paper for the same URL starts without a download
+and already knows the content hash. Least recently used files are evicted
+once the store grows past PDF_STORE_MAX_MB, except files pinned by a running
+analysis (lookup(url, pin=True) ... release(path)).
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from downloader import fetch_pdf, DOWNLOAD_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+PDF_STORE_PATH = os.getenv("PDF_STORE_PATH", "./pdf_store")
+PDF_STORE_MAX_MB = float(os.getenv("PDF_STORE_MAX_MB", "2048"))
+
+
+class PDFStore:
+    """PDFs on disk addressed by content hash, indexed by the URL they came from."""
+
+    def __init__(self, root: str = PDF_STORE_PATH, max_mb: float = PDF_STORE_MAX_MB):
+        self.root = os.path.abspath(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._pins = Counter()  # sha256 -> running jobs using the file
+        self._executor = None
+        self._conn = sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pdfs (
+                url      TEXT PRIMARY KEY,
+                sha256   TEXT NOT NULL,
+                size     INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pdfs_sha ON pdfs(sha256)")
+        self._conn.commit()
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.pdf")
+
+    def owns(self, path: str) -> bool:
+        """True if path is a file managed by this store (callers must not delete it)."""
+        return bool(path) and os.path.abspath(path).startswith(self.root + os.sep)
+
+    def lookup(self, url: str, pin: bool = False):
+        """
+        {"path", "sha256", "size"} for an already stored URL, else None.
+        With pin=True the file is kept from eviction until release(path).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT sha256, size FROM pdfs WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            path = self.path_for(row[0])
+            if not os.path.exists(path):
+                self._conn.execute("DELETE FROM pdfs WHERE sha256 = ?", (row[0],))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE pdfs SET accessed = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+            if pin:
+                self._pins[row[0]] += 1
+        return {"path": path, "sha256": row[0], "size": row[1]}
+
+    def release(self, path: str):
+        """Drop one pin taken by lookup(url, pin=True) on the file at path."""
+        digest = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            if self._pins[digest] > 1:
+                self._pins[digest] -= 1
+            else:
+                self._pins.pop(digest, None)
+
+    def fetch(self, url: str):
+        """Return the stored copy of url, downloading it into the store first if needed."""
+        stored = self.lookup(url)
+        if stored:
+            return stored
+        fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=self.root)
+        os.close(fd)
+        try:
+            downloaded = fetch_pdf(url, dest_path=tmp_path)
+            if not downloaded:
+                return None
+            path = self.path_for(downloaded["sha256"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not os.path.exists(path):
+                os.replace(tmp_path, path)
+            # else: same content already stored under another URL
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pdfs (url, sha256, size, accessed) VALUES (?, ?, ?, ?)",
+                (url, downloaded["sha256"], downloaded["size"], time.time())
+            )
+            self._conn.commit()
+        self._evict()
+        return {"path": path, "sha256": downloaded["sha256"], "size": downloaded["size"]}
+
+    def _prefetch_one(self, url: str):
+        try:
+            self.fetch(url)
+        except Exception as e:
+            logger.warning(f"⚠️ Prefetch failed for {url}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(url)
+
+    def prefetch(self, urls: list) -> int:
+        """Download URLs that aren't stored yet in the background; returns how many were scheduled."""
+        scheduled = 0
+        for url in urls:
+            if not url or not url.startswith("http"):
+                continue
+            with self._lock:
+                if url in self._inflight:
+                    continue
+                known = self._conn.execute("SELECT 1 FROM pdfs WHERE url = ?", (url,)).fetchone()
+                if known:
+                    continue
+                self._inflight.add(url)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=DOWNLOAD_CONCURRENCY, thread_name_prefix="pdf-prefetch")
+            self._executor.submit(self._prefetch_one, url)
+            scheduled += 1
+        return scheduled
+
+    def _evict(self):
+        """Remove least recently used unpinned files until the store fits max_bytes."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sha256, MAX(size), MAX(accessed) FROM pdfs GROUP BY sha256 ORDER BY MAX(accessed)"
+            ).fetchall()
+            total = sum(r[1] for r in rows)
+            for digest, size, _ in rows:
+                if total <= self.max_bytes:
+                    break
+                if self._pins[digest]:
+                    continue
+                try:
+                    os.unlink(self.path_for(digest))
+                except FileNotFoundError:
+                    pass
+                self._conn.execute("DELETE FROM pdfs WHERE sha256 = ?", (digest,))
+                total -= size
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, size = self._conn.execute(
+                "SELECT COUNT(DISTINCT sha256), COALESCE(SUM(size), 0) FROM (SELECT sha256, MAX(size) AS size FROM pdfs GROUP BY sha256)"
+            ).fetchone()
+            return {
+                "files": files,
+                "size_bytes": size,
+                "max_bytes": self.max_bytes,
+                "prefetching": len(self._inflight),
+                "pinned": sum(1 for n in self._pins.values() if n),
+            }
+
+
+pdf_store = PDFStore()
@@ -0,0 +1,50 @@
+"""
+Single-pass PDF text extraction.
+
+Pages are streamed one at a time from PyMuPDF; extract_pdf_text() walks them
+once and keeps the character offset where each page starts, so downstream
+chunks can be mapped back to page numbers without re-parsing the file.
+"""
+import bisect
+
+import fitz  # PyMuPDF
+
+from metrics import span
+
+
+def iter_pages(path: str):
+    """Yield (page_number, text) for each page, 1-based, without holding the whole document text."""
+    doc = fitz.open(path)
+    try:
+        for page in doc:
+            yield page.number + 1, page.get_text()
+    finally:
+        doc.close()
+
+
+class PDFText:
+    """Full text of a PDF plus the start offset of every page inside it."""
+
+    def __init__(self, path: str, text: str, page_offsets: list):
+        self.path = path
+        self.text = text
+        self.page_offsets = page_offsets
+
+    def page_for_offset(self, offset: int) -> int:
+        """1-based page number containing the given character offset."""
+        if not self.page_offsets:
+            return 1
+        return max(1, bisect.bisect_right(self.page_offsets, offset))
+
+
+def extract_pdf_text(path: str) -> PDFText:
+    """Extract a PDF's text once, streaming pages and recording page offsets."""
+    parts = []
+    page_offsets = []
+    offset = 0
+    with span("pdf_extraction", "extract_pdf_text", path=path):
+        for _, text in iter_pages(path):
+            page_offsets.append(offset)
+            parts.append(text)
+            offset += len(text)
+    return PDFText(path, "".join(parts), page_offsets)
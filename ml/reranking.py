@@ -0,0 +1,72 @@
+"""
+Re-ranking of retrieved chunks using the embeddings Chroma already returns.
+"""
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _rescale(values: np.ndarray) -> np.ndarray:
+    """Min-max scale to [0, 1]; all-equal values become 1."""
+    spread = values.max() - values.min()
+    if spread <= 1e-12:
+        return np.ones_like(values)
+    return (values - values.min()) / spread
+
+
+def mmr_select(query_embedding, embeddings, k: int, lambda_mult: float = 0.5, relevance=None) -> list:
+    """
+    Maximal marginal relevance: greedily pick k indices that balance relevance
+    to the query (lambda_mult=1.0) against novelty w.r.t. already picked items
+    (lambda_mult=0.0). Cosine similarity, fully vectorized with NumPy.
+    relevance, if given, replaces cosine-to-query as the relevance term (e.g.
+    hybrid retrieval's fused scores); it is rescaled to [0, 1].
+    """
+    emb = np.asarray(embeddings, dtype=np.float32)
+    if emb.ndim != 2 or not len(emb):
+        return []
+    k = min(k, len(emb))
+    emb = _normalize(emb)
+    q = _normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+
+    if relevance is None:
+        relevance = emb @ q
+    else:
+        relevance = _rescale(np.asarray(relevance, dtype=np.float32))
+    pairwise = emb @ emb.T
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything already selected
+    max_sim = pairwise[selected[0]].copy()
+    available = np.ones(len(emb), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim, pairwise[best], out=max_sim)
+    return selected
+
+
+def mmr_rerank(query_embedding, chunks: list, k: int, lambda_mult: float = 0.5) -> list:
+    """
+    Apply mmr_select to chunks carrying an "embedding" key; others are appended after.
+    When every chunk carries a fused hybrid "score", that score is the relevance
+    term, so exact-term BM25 hits aren't demoted back to their cosine rank.
+    """
+    with_emb = [c for c in chunks if c.get("embedding") is not None]
+    if len(with_emb) <= 1:
+        return chunks[:k]
+    scores = [c.get("score") for c in with_emb]
+    relevance = scores if all(s is not None for s in scores) else None
+    picked = [with_emb[i] for i in mmr_select(
+        query_embedding, [c["embedding"] for c in with_emb], k, lambda_mult, relevance=relevance
+    )]
+    if len(picked) < k:
+        picked += [c for c in chunks if c.get("embedding") is None][:k - len(picked)]
+    return picked
@@ -1,14 +1,17 @@
-from langchain_ollama import OllamaLLM
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 import os, json, re
+import logging
+from model_registry import get_llm
+from parallel import bounded_map
+from pdf_sections import segment_sections
+from metrics import prompt_config
 
-llm = OllamaLLM(
-    model="llama3:8b",
-    base_url="http://100.74.147.124:11434"  
-)
+logger = logging.getLogger(__name__)
+
+llm = get_llm()
 
 def normalize_summary_data(summary_json, metadata=None):
     """Ensure all required fields exist and inject metadata."""
@@ -57,18 +60,15 @@ def summarize_pdf(pdf_path, metadata=None):
     combined_text = "\n".join([c.page_content for c in chunks])
 
     # ── DEBUG: show input size ──────────────────────────────────────────────
-    print(f"\n{'='*60}")
-    print(f"[DEBUG] PDF path: {pdf_path}")
-    print(f"[DEBUG] Total chunks from splitter: {len(chunks)}")
-    print(f"[DEBUG] Combined text length (chars): {len(combined_text)}")
-    print(f"[DEBUG] First 500 chars of combined_text:")
-    print(combined_text[:500])
-    print(f"{'='*60}\n")
+    logger.debug(f"PDF path: {pdf_path}")
+    logger.debug(f"Total chunks from splitter: {len(chunks)}")
+    logger.debug(f"Combined text length (chars): {len(combined_text)}")
+    logger.debug(f"First 500 chars of combined_text:\n{combined_text[:500]}")
 
     # Truncate to ~6000 chars to stay within LLaMA 3:8b context window
     MAX_CONTEXT_CHARS = 6000
     if len(combined_text) > MAX_CONTEXT_CHARS:
-        print(f"[DEBUG] ⚠️ Truncating combined_text from {len(combined_text)} to {MAX_CONTEXT_CHARS} chars")
+        logger.debug(f"⚠️ Truncating combined_text from {len(combined_text)} to {MAX_CONTEXT_CHARS} chars")
         combined_text = combined_text[:MAX_CONTEXT_CHARS]
 
     prompt_template = """
@@ -93,14 +93,11 @@ def summarize_pdf(pdf_path, metadata=None):
     prompt = ChatPromptTemplate.from_template(prompt_template)
     summarizer_chain = prompt | llm | StrOutputParser()
 
-    print("⚙️ Generating structured summary...")
-    raw_output = summarizer_chain.invoke({"context": combined_text})
+    logger.info("⚙️ Generating structured summary...")
+    raw_output = summarizer_chain.invoke({"context": combined_text}, config=prompt_config("structured_summary"))
 
     # ── DEBUG: show raw LLM response ───────────────────────────────────────
-    print(f"\n{'='*60}")
-    print("[DEBUG] RAW LLM OUTPUT:")
-    print(raw_output)
-    print(f"{'='*60}\n")
+    logger.debug(f"RAW LLM OUTPUT:\n{raw_output}")
 
     # Strip markdown code fences if present (e.g. ```json ... ``` )
     cleaned_output = re.sub(r"```(?:json)?\s*", "", raw_output).replace("```", "").strip()
@@ -109,30 +106,30 @@ def summarize_pdf(pdf_path, metadata=None):
     summary_json = None
     try:
         summary_json = json.loads(cleaned_output)
-        print("[DEBUG] ✅ Direct json.loads succeeded.")
+        logger.debug("✅ Direct json.loads succeeded.")
     except json.JSONDecodeError as e:
-        print(f"[DEBUG] ❌ Direct json.loads failed: {e}")
+        logger.debug(f"❌ Direct json.loads failed: {e}")
 
     # Fallback: extract first {...} block
     if summary_json is None:
         match = re.search(r"\{.*\}", cleaned_output, re.DOTALL)
         if match:
             candidate = match.group(0)
-            print(f"[DEBUG] Trying regex-extracted JSON ({len(candidate)} chars): {candidate[:200]}...")
+            logger.debug(f"Trying regex-extracted JSON ({len(candidate)} chars): {candidate[:200]}...")
             try:
                 summary_json = json.loads(candidate)
-                print("[DEBUG] ✅ Regex-extracted JSON parsed successfully.")
+                logger.debug("✅ Regex-extracted JSON parsed successfully.")
             except json.JSONDecodeError as e:
-                print(f"[DEBUG] ❌ Regex-extracted JSON also failed: {e}")
-                print(f"[DEBUG] Problematic JSON candidate:\n{candidate}")
+                logger.debug(f"❌ Regex-extracted JSON also failed: {e}")
+                logger.debug(f"Problematic JSON candidate:\n{candidate}")
 
     if summary_json is None:
-        print("[DEBUG] ⚠️ All JSON parse attempts failed. Returning raw_summary fallback.")
+        logger.debug("⚠️ All JSON parse attempts failed. Returning raw_summary fallback.")
         summary_json = {"raw_summary": raw_output}
 
     # ── DEBUG: show parsed dict keys ───────────────────────────────────────
-    print(f"[DEBUG] Parsed summary_json keys: {list(summary_json.keys())}")
-    print(f"[DEBUG] Full parsed dict: {json.dumps(summary_json, indent=2)[:800]}")
+    logger.debug(f"Parsed summary_json keys: {list(summary_json.keys())}")
+    logger.debug(f"Full parsed dict: {json.dumps(summary_json, indent=2)[:800]}")
 
     summary_json = normalize_summary_data(summary_json, metadata)
 
@@ -140,90 +137,159 @@ def summarize_pdf(pdf_path, metadata=None):
     with open(output_file, "w") as f:
         json.dump(summary_json, f, indent=2)
 
-    print(f"[DEBUG] Saved structured summary to {output_file}")
-    print(f"[DEBUG] Final returned keys: {list(summary_json.keys())}")
+    logger.debug(f"Saved structured summary to {output_file}")
+    logger.debug(f"Final returned keys: {list(summary_json.keys())}")
     return summary_json
 
 
 # ================= ENRICHMENT FUNCTIONS =================
 
-def extract_section_summaries(full_text: str) -> list:
+def extract_section_summaries(full_text: str, pdf_path: str = None, sections: list = None) -> list:
     """
-    Extracts summaries for standard sections: Abstract, Introduction, Methods, Results, Discussion, Conclusion.
-    Returns a list of dicts: [{"section": "Methods", "content": "..."}]
+    Summarize each section of the paper in its own small prompt.
+    Sections come from pdf_sections.segment_sections (font-size/numbering
+    heading detection, no LLM) unless the caller already segmented the paper,
+    and the per-section calls run concurrently.
+    Returns a list of dicts: [{"section": "3 Methods", "content": "...", "page": 4}]
     """
-    # Limit text to avoid context window issues, but keep it large enough
-    # For a real robust solution, we might need chunking, but for now let's take first 15k chars + last 5k
-    if len(full_text) > 20000:
-        context_text = full_text[:15000] + "\n...[skipped]...\n" + full_text[-5000:]
-    else:
-        context_text = full_text
+    if sections is None:
+        sections = segment_sections(full_text, pdf_path)
+    if not sections:
+        return []
 
     prompt_template = """
     You are an expert research analyst.
-    Summarize the following sections from the paper text below.
-    If a section is missing, skip it.
-
-    Sections to summarize:
-    1. Abstract
-    2. Introduction
-    3. Methods
-    4. Results
-    5. Discussion
-    6. Conclusion
+    Summarize the section "{section}" of a research paper in 3-5 sentences.
+    Keep the concrete methods, datasets and numeric results it mentions.
+    Return plain text only, without headings or markdown.
 
-    Return ONLY valid JSON in this format:
-    [
-      {{"section": "Abstract", "content": "..."}},
-      {{"section": "Methods", "content": "..."}}
-    ]
-
-    Paper Text:
+    Section text:
     {context}
     """
-    
+
     prompt = ChatPromptTemplate.from_template(prompt_template)
     chain = prompt | llm | StrOutputParser()
-    
-    print("⚙️ Extracting section summaries...")
+
+    def _summarize_section(section):
+        try:
+            raw_output = chain.invoke(
+                {"section": section["section"], "context": section["text"]},
+                config=prompt_config("section_summary")
+            )
+            return raw_output.strip()
+        except Exception as e:
+            logger.warning(f"⚠️ Section '{section['section']}' summary failed: {e}")
+            return ""
+
+    logger.info(f"⚙️ Summarizing {len(sections)} sections...")
+    summaries = bounded_map(_summarize_section, sections)
+    return [
+        {"section": section["section"], "content": content, "page": section["page"]}
+        for section, content in zip(sections, summaries)
+        if content
+    ]
+
+
+# Rough chars-per-token ratio for llama3 on English prose
+CHARS_PER_TOKEN = 4
+# Input tokens of paragraph text packed into one rewrite prompt
+REWRITE_BATCH_TOKENS = int(os.getenv("REWRITE_BATCH_TOKENS", "1500"))
+
+
+def split_paragraphs(full_text: str, min_chars: int = 100) -> list:
+    """
+    Split text on blank lines, dropping short lines/headers.
+    Returns [(char_offset, paragraph)] where char_offset points into full_text.
+    """
+    paragraphs = []
+    pos = 0
+    for part in full_text.split('\n\n'):
+        stripped = part.strip()
+        if len(stripped) > min_chars:
+            paragraphs.append((pos + len(part) - len(part.lstrip()), stripped))
+        pos += len(part) + 2
+    return paragraphs
+
+
+def pack_paragraphs(paragraphs: list, token_budget: int = REWRITE_BATCH_TOKENS) -> list:
+    """
+    Greedily group consecutive (index, paragraph) pairs so each group stays
+    within token_budget. A paragraph larger than the budget gets its own group.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for idx, p in enumerate(paragraphs):
+        tokens = len(p) // CHARS_PER_TOKEN + 1
+        if current and current_tokens + tokens > token_budget:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((idx, p))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _rewrite_batch(chain, batch: list) -> list:
+    """Rewrite one packed batch; paragraphs the model drops keep their original text."""
+    numbered = "\n\n".join(f"[{idx}] {p}" for idx, p in batch)
+    rewrites = {}
     try:
-        raw_output = chain.invoke({"context": context_text})
+        raw_output = chain.invoke({"paragraphs": numbered}, config=prompt_config("paragraph_rewrite"))
         match = re.search(r"\[.*\]", raw_output, re.DOTALL)
         if match:
-            return json.loads(match.group(0))
+            for item in json.loads(match.group(0)):
+                if not isinstance(item, dict) or not str(item.get("rewrite") or "").strip():
+                    continue
+                try:
+                    rewrites[int(item.get("index"))] = str(item["rewrite"]).strip()
+                except (TypeError, ValueError):
+                    continue
     except Exception as e:
-        print(f"⚠️ Section extraction failed: {e}")
-    
-    return []
+        logger.warning(f"⚠️ Paragraph batch rewrite failed at idx {batch[0][0]}-{batch[-1][0]}: {e}")
+
+    results = []
+    for idx, p in batch:
+        rewritten = idx in rewrites
+        results.append({
+            "paragraph_index": idx,
+            "content": rewrites[idx] if rewritten else p,
+            "rewritten": rewritten
+        })
+    return results
 
 
 def rewrite_paragraphs(full_text: str) -> list:
     """
     Splits text into paragraphs and rewrites them for clarity/conciseness.
-    Returns list of strings.
+    Paragraphs are packed several per prompt up to REWRITE_BATCH_TOKENS and the
+    batches run concurrently, so the whole paper is covered.
+    Returns list of dicts:
+    [{"paragraph_index": 0, "char_offset": 0, "content": "...", "rewritten": True}]
+    """
+    paragraphs = split_paragraphs(full_text)
+    raw_paragraphs = [p for _, p in paragraphs]
+    batches = pack_paragraphs(raw_paragraphs)
+    logger.info(f"⚙️ Rewriting {len(raw_paragraphs)} paragraphs in {len(batches)} batches...")
+
+    prompt_template = """
+    Rewrite each numbered paragraph below to be clear, concise, and self-contained for retrieval.
+    Keep the numbering. Return ONLY valid JSON in this format:
+    [
+      {{"index": 0, "rewrite": "..."}},
+      {{"index": 1, "rewrite": "..."}}
+    ]
+
+    Paragraphs:
+    {paragraphs}
     """
-    # Simple splitting by double newline, filtering out short lines/headers
-    raw_paragraphs = [p.strip() for p in full_text.split('\n\n') if len(p.strip()) > 100]
-    
-    # Limit to first 20 paragraphs to save time/tokens for this demo
-    # In production, you might process all or use a sliding window
-    selected_paragraphs = raw_paragraphs[:20]
-    
-    rewritten = []
-    print(f"⚙️ Rewriting {len(selected_paragraphs)} paragraphs...")
-    
-    # We can batch this or do it one by one. One by one is safer for local LLM context.
-    prompt_template = "Rewrite this paragraph to be clear, concise, and self-contained for retrieval:\n\n{text}"
     prompt = ChatPromptTemplate.from_template(prompt_template)
     chain = prompt | llm | StrOutputParser()
-    
-    for i, p in enumerate(selected_paragraphs):
-        try:
-            res = chain.invoke({"text": p})
-            rewritten.append(res.strip())
-        except Exception as e:
-            print(f"⚠️ Paragraph rewrite failed at idx {i}: {e}")
-            
+
+    results = bounded_map(lambda batch: _rewrite_batch(chain, batch), batches)
+    rewritten = [item for batch_result in results for item in batch_result]
+    for item in rewritten:
+        item["char_offset"] = paragraphs[item["paragraph_index"]][0]
     return rewritten
 
 
@@ -249,14 +315,14 @@ def extract_concepts(summary: str) -> list:
     prompt = ChatPromptTemplate.from_template(prompt_template)
     chain = prompt | llm | StrOutputParser()
     
-    print("⚙️ Extracting concepts...")
+    logger.info("⚙️ Extracting concepts...")
     try:
-        raw_output = chain.invoke({"summary": summary})
+        raw_output = chain.invoke({"summary": summary}, config=prompt_config("concepts"))
         match = re.search(r"\[.*\]", raw_output, re.DOTALL)
         if match:
             return json.loads(match.group(0))
     except Exception as e:
-        print(f"⚠️ Concept extraction failed: {e}")
+        logger.warning(f"⚠️ Concept extraction failed: {e}")
         
     return []
 
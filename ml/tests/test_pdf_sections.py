@@ -0,0 +1,35 @@
+import pytest
+
+from pdf_sections import _looks_like_heading
+
+BODY = 10.0
+
+
+@pytest.mark.parametrize("text", [
+    "analysis in Section 3.",
+    "results.",
+    "model is trained on",
+    "approach to this problem.",
+])
+def test_body_lines_are_not_headings(text):
+    assert not _looks_like_heading(text, size=BODY, bold=False, body_size=BODY)
+    assert not _looks_like_heading(text)
+
+
+@pytest.mark.parametrize("text, size, bold", [
+    ("3 Methods", 12.0, False),
+    ("Introduction", BODY, True),
+    ("2.1 Training Setup", BODY, True),
+    ("Abstract.", 12.0, False),
+])
+def test_headings_with_layout(text, size, bold):
+    assert _looks_like_heading(text, size=size, bold=bold, body_size=BODY)
+
+
+@pytest.mark.parametrize("text", ["Introduction", "3 Methods", "Abstract.", "IV. Experiments"])
+def test_headings_without_layout(text):
+    assert _looks_like_heading(text)
+
+
+def test_captions_are_not_headings():
+    assert not _looks_like_heading("Figure 2: Overview", size=12.0, bold=True, body_size=BODY)
@@ -1,28 +1,214 @@
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import numpy as np
+import logging
+import os
 import uuid
 import json
+import threading
+from collections import Counter, OrderedDict
 from typing import Any
 
+from model_registry import get_chroma_client, get_embedding_model, EMBEDDING_MODEL_NAME
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from metrics import span, InstrumentedCollection, EMBEDDED_TEXTS
+
+logger = logging.getLogger(__name__)
+
+# Fuse BM25 with dense results in query_enriched_chunks unless HYBRID_RETRIEVAL=0
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of query embeddings.
+    Keyed on (model identity, normalized query text). Only the query path
+    uses it, so bulk ingestion never evicts hot queries.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Stored on paper entries for reuse by the service, never returned to clients
+INTERNAL_METADATA_KEYS = frozenset({"summary_json"})
+
+
+class ChunkCountIndex:
+    """
+    Per-user index of paper doc_ids and their enriched-chunk counts.
+    Built from one bulk metadata scan on first use, then maintained by
+    add_paper_to_db / store_enriched_chunks / delete_paper, so finding papers
+    without chunks is a set lookup instead of one query per paper.
+    """
+
+    def __init__(self):
+        self._users = {}  # uid -> {"papers": set, "chunks": Counter}
+        self._lock = threading.Lock()
+
+    def loaded(self, uid: str) -> bool:
+        return uid in self._users
+
+    def rebuild(self, uid: str, scan) -> tuple:
+        """
+        Replace uid's entry with scan() -> (papers, chunk_counts). The lock is
+        held for the whole scan, so add/remove calls made meanwhile wait and
+        are applied on top of the result instead of being dropped.
+        """
+        with self._lock:
+            papers, chunk_counts = scan()
+            self._users[uid] = {"papers": set(papers), "chunks": Counter(chunk_counts)}
+        return papers, chunk_counts
+
+    def add_paper(self, uid: str, doc_id: str):
+        with self._lock:
+            if uid in self._users:
+                self._users[uid]["papers"].add(doc_id)
+
+    def add_chunks(self, uid: str, doc_id_counts: Counter):
+        with self._lock:
+            if uid in self._users:
+                self._users[uid]["chunks"].update(doc_id_counts)
+
+    def remove_paper(self, uid: str, doc_id: str):
+        with self._lock:
+            if uid in self._users:
+                self._users[uid]["papers"].discard(doc_id)
+                self._users[uid]["chunks"].pop(doc_id, None)
+
+    def count(self, uid: str, doc_id: str) -> int:
+        with self._lock:
+            return self._users[uid]["chunks"].get(doc_id, 0)
+
+    def chunk_counts(self, uid: str) -> dict:
+        with self._lock:
+            entry = self._users[uid]
+            return {doc_id: entry["chunks"].get(doc_id, 0) for doc_id in entry["papers"]}
+
+    def orphans(self, uid: str) -> list:
+        with self._lock:
+            entry = self._users[uid]
+            return [d for d in entry["papers"] if entry["chunks"].get(d, 0) == 0]
+
+
 class VectorStore:
+    """
+    Thin wrapper around the process-wide Chroma client and embedding model.
+    Both are loaded lazily by model_registry on first use, so constructing
+    a VectorStore is cheap and every instance shares the same resources.
+    """
+
     def __init__(self):
-        # Initialize Chroma client (local persistent database)
-        self.client = chromadb.PersistentClient(path="./chroma_db")
-        # Load lightweight embedding model
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+        self.query_cache = QueryEmbeddingCache(
+            max_size=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+        )
+        self.chunk_index = ChunkCountIndex()
+        self._lexical = {}  # uid -> BM25Index, built lazily from stored chunks
+        self._lexical_lock = threading.Lock()
+        self._change_listeners = []
+
+    def on_change(self, callback):
+        """Register callback(uid, doc_ids) fired whenever papers or chunks are written or deleted."""
+        self._change_listeners.append(callback)
+
+    def _notify_change(self, uid: str, doc_ids):
+        for callback in self._change_listeners:
+            try:
+                callback(uid, list(doc_ids))
+            except Exception as e:
+                logger.warning(f"⚠️ Vector store change listener failed: {e}")
+
+    @property
+    def client(self):
+        return get_chroma_client()
+
+    @property
+    def embedding_model(self):
+        return get_embedding_model()
 
     def get_collection(self, uid: str):
-        """Get or create a collection for a specific user."""
+        """Get or create a collection for a specific user; its data operations are timed."""
         name = f"user_{uid}"
-        return self.client.get_or_create_collection(
-            name=name,
-            metadata={"owner": uid}
-        )
+        with span("chroma", "get_or_create_collection"):
+            collection = self.client.get_or_create_collection(
+                name=name,
+                metadata={"owner": uid}
+            )
+        return InstrumentedCollection(collection)
 
     def embed_text(self, text: str):
         """Generate embedding vector for a given text."""
-        return self.embedding_model.encode(text).tolist()
+        model = self.embedding_model
+        with span("embedding", "embed_text"):
+            emb = model.encode(text).tolist()
+        EMBEDDED_TEXTS.inc(op="embed_text")
+        return emb
+
+    def embed_query(self, query: str):
+        """Embedding for a search query, served from the LRU cache when possible."""
+        normalized = " ".join((query or "").split())
+        key = (EMBEDDING_MODEL_NAME, normalized)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+        emb = self.embed_text(normalized)
+        self.query_cache.put(key, emb)
+        return emb
+
+    def embed_batch(self, texts: list, batch_size: int = 64) -> np.ndarray:
+        """
+        Encode many texts in one vectorized call.
+        Returns a contiguous float32 array of shape (len(texts), dim).
+        """
+        if not texts:
+            dim = self.embedding_model.get_sentence_embedding_dimension()
+            return np.empty((0, dim), dtype=np.float32)
+        model = self.embedding_model
+        with span("embedding", "embed_batch", texts=len(texts)):
+            embeddings = model.encode(
+                list(texts),
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        EMBEDDED_TEXTS.inc(len(texts), op="embed_batch")
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
 
     def _ensure_insights_dict(self, insights: Any) -> dict:
         """Ensure insights is always a dict."""
@@ -40,6 +226,11 @@ class VectorStore:
             return json.dumps(value)
         return str(value)
 
+    @staticmethod
+    def _public_metadata(meta: dict) -> dict:
+        """Paper metadata without the fields kept only for internal reuse."""
+        return {k: v for k, v in (meta or {}).items() if k not in INTERNAL_METADATA_KEYS}
+
     def _sanitize_metadata(self, meta: dict) -> dict:
         """Ensure all metadata values are JSON-safe (convert lists/dicts to strings)."""
         safe_meta = {}
@@ -71,7 +262,7 @@ class VectorStore:
                 p for p in [flat_summary] + insight_parts if p and p.strip()
             ).strip()
 
-            print(f"[DEBUG] add_paper_to_db combined_text length: {len(combined_text)} chars")
+            logger.debug(f"add_paper_to_db combined_text length: {len(combined_text)} chars")
 
             # Generate embedding
             embedding = self.embed_text(combined_text)
@@ -96,17 +287,19 @@ class VectorStore:
                 metadatas=[metadata_with_insights],
             )
 
-            print(f"✅ Stored '{title}' (id={paper_uid}) in ChromaDB for user {uid}.")
+            self.chunk_index.add_paper(uid, paper_uid)
+            self._notify_change(uid, [paper_uid])
+            logger.info(f"✅ Stored '{title}' (id={paper_uid}) in ChromaDB for user {uid}.")
             return paper_uid
 
         except Exception as e:
-            print("⚠️ add_paper_to_db error:", e)
+            logger.warning(f"⚠️ add_paper_to_db error: {e}")
             return None
 
     def query_papers(self, uid: str, query: str, n_results: int = 3):
         """Retrieve top similar papers for a user."""
         collection = self.get_collection(uid)
-        query_emb = self.embed_text(query)
+        query_emb = self.embed_query(query)
         
         results = collection.query(
             query_embeddings=[query_emb], 
@@ -141,7 +334,7 @@ class VectorStore:
                 "summary": docs[i] if i < len(docs) else "",
                 "insights": insights_data,
                 "distance": distances[i] if i < len(distances) else None,
-                "metadata": meta
+                "metadata": self._public_metadata(meta)
             })
 
         return {"papers": items}
@@ -154,13 +347,12 @@ class VectorStore:
         collection = self.get_collection(uid)
         ids = []
         documents = []
-        embeddings = []
         metadatas = []
 
-        print(f"Storing {len(chunks)} enriched chunks for user {uid}...")
+        logger.info(f"Storing {len(chunks)} enriched chunks for user {uid}...")
 
         for chunk in chunks:
-            content = chunk.get("content", "").strip()
+            content = (chunk.get("content") or "").strip()
             if not content:
                 continue
 
@@ -170,31 +362,72 @@ class VectorStore:
             chunk_meta["uid"] = uid
             chunk_meta.pop("content", None)
             chunk_meta = self._sanitize_metadata(chunk_meta)
-            
-            emb = self.embed_text(content)
-            chunk_uid = str(uuid.uuid4())
-            
-            ids.append(chunk_uid)
+
+            ids.append(str(uuid.uuid4()))
             documents.append(content)
-            embeddings.append(emb)
             metadatas.append(chunk_meta)
 
         if ids:
             try:
+                # One vectorized encode for every chunk instead of one call per chunk
+                embeddings = self.embed_batch(documents)
                 collection.add(
                     ids=ids,
                     documents=documents,
                     embeddings=embeddings,
                     metadatas=metadatas
                 )
-                print(f"Successfully stored {len(ids)} enriched chunks.")
+                self.chunk_index.add_chunks(uid, Counter(m.get("doc_id") for m in metadatas if m.get("doc_id")))
+
+                def _add(index):
+                    for chunk_id, doc, meta in zip(ids, documents, metadatas):
+                        index.add(chunk_id, doc, meta.get("doc_id"))
+
+                self._update_lexical(uid, _add)
+                self._notify_change(uid, {m.get("doc_id") for m in metadatas if m.get("doc_id")})
+                logger.info(f"Successfully stored {len(ids)} enriched chunks.")
             except Exception as e:
-                print(f"Failed to store enriched chunks: {e}")
+                logger.warning(f"Failed to store enriched chunks: {e}")
 
-    def query_enriched_chunks(self, uid: str, query: str, n_results: int = 5, doc_ids: list = None):
-        """Retrieve enriched chunks for RAG for a user."""
+    def _update_lexical(self, uid: str, update):
+        """
+        Apply update(index) to the user's BM25 index if it has been built.
+        Callers write to Chroma first; holding _lexical_lock means the change
+        either lands after a concurrent build or is already in its scan.
+        """
+        with self._lexical_lock:
+            index = self._lexical.get(uid)
+            if index is not None:
+                update(index)
+
+    def lexical_index(self, uid: str) -> BM25Index:
+        """The user's BM25 index, built from their stored chunks on first use."""
+        index = self._lexical.get(uid)
+        if index is not None:
+            return index
+        with self._lexical_lock:
+            if uid not in self._lexical:
+                index = BM25Index()
+                for _id, meta, doc in self.scan_entries(uid, {"entry_type": "chunk"}, ["metadatas", "documents"]):
+                    index.add(_id, doc, meta.get("doc_id"))
+                self._lexical[uid] = index
+                logger.info(f"🔤 Built BM25 index for user {uid} ({len(index)} chunks)")
+        return self._lexical[uid]
+
+    def query_enriched_chunks(self, uid: str, query: str, n_results: int = 5, doc_ids: list = None,
+                              hybrid: bool = None, include_embeddings: bool = False):
+        """
+        Retrieve enriched chunks for RAG for a user.
+        In hybrid mode (default, see HYBRID_RETRIEVAL) dense and BM25 candidates
+        are fused with reciprocal rank fusion, so exact terms are not missed.
+        With include_embeddings each chunk also carries its stored "embedding".
+        """
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        hybrid = HYBRID_RETRIEVAL if hybrid is None else hybrid
         collection = self.get_collection(uid)
-        query_emb = self.embed_text(query)
+        query_emb = self.embed_query(query)
         
         where_filter = None
         if doc_ids:
@@ -202,33 +435,65 @@ class VectorStore:
                 where_filter = {"doc_id": doc_ids[0]}
             else:
                 where_filter = {"doc_id": {"$in": doc_ids}}
-                
+
+        # Over-fetch candidates for fusion
+        candidates = n_results * 2 if hybrid else n_results
         results = collection.query(
             query_embeddings=[query_emb],
-            n_results=n_results,
-            where=where_filter
+            n_results=candidates,
+            where=where_filter,
+            include=include
         )
         
         ids = (results.get("ids") or [[]])[0]
         docs = (results.get("documents") or [[]])[0]
         metas = (results.get("metadatas") or [[]])[0]
         distances = (results.get("distances") or [[]])[0]
+        embeddings = results.get("embeddings")
+        embeddings = embeddings[0] if embeddings is not None and len(embeddings) else []
         
         chunks = []
         for i, _id in enumerate(ids):
-            chunks.append({
+            chunk = {
                 "id": _id,
                 "content": docs[i] if i < len(docs) else "",
                 "metadata": metas[i] if i < len(metas) else {},
                 "distance": distances[i] if i < len(distances) else 0.0
-            })
-            
-        return chunks
+            }
+            if include_embeddings:
+                chunk["embedding"] = embeddings[i] if i < len(embeddings) else None
+            chunks.append(chunk)
+
+        if not hybrid:
+            return chunks
+
+        lexical = self.lexical_index(uid).search(query, k=candidates, doc_ids=doc_ids)
+        if not lexical:
+            return chunks[:n_results]
+
+        fused = reciprocal_rank_fusion([[c["id"] for c in chunks], [cid for cid, _ in lexical]])[:n_results]
+        by_id = {c["id"]: c for c in chunks}
+        missing = [cid for cid, _ in fused if cid not in by_id]
+        if missing:
+            extra_include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+            extra = collection.get(ids=missing, include=extra_include)
+            for i, _id in enumerate(extra.get("ids") or []):
+                by_id[_id] = {
+                    "id": _id,
+                    "content": extra["documents"][i] or "",
+                    "metadata": extra["metadatas"][i] or {},
+                    "distance": None  # lexical-only hit
+                }
+                if include_embeddings:
+                    by_id[_id]["embedding"] = extra["embeddings"][i]
+        return [dict(by_id[cid], score=score) for cid, score in fused if cid in by_id]
 
-    def get_enriched_paper(self, uid: str, paper_id: str):
+    def get_enriched_paper(self, uid: str, paper_id: str, include_summary_json: bool = False):
         """
         Fetch a paper and all its enriched chunks.
         Returns structured data organized by chunk type.
+        include_summary_json adds the stored structured summary (a JSON string)
+        as paper["summary_json"]; it is never part of the returned metadata.
         """
         collection = self.get_collection(uid)
         
@@ -270,8 +535,10 @@ class VectorStore:
             "pdf_url": paper_meta.get("pdf_url", "N/A"),
             "summary": paper_doc,
             "insights": insights_data,
-            "metadata": paper_meta
+            "metadata": self._public_metadata(paper_meta)
         }
+        if include_summary_json:
+            paper_data["summary_json"] = paper_meta.get("summary_json")
         
         # 2. Fetch all enriched chunks for this paper
         chunk_results = collection.get(
@@ -334,8 +601,138 @@ class VectorStore:
         
         # Delete by metadata doc_id (chunks and main entry if ID matches)
         collection.delete(where={"doc_id": paper_id})
-        
-        print(f"🗑️ Deleted paper {paper_id} for user {uid}")
+
+        self.chunk_index.remove_paper(uid, paper_id)
+        self._update_lexical(uid, lambda index: index.remove_doc(paper_id))
+        self._notify_change(uid, [paper_id])
+        logger.info(f"🗑️ Deleted paper {paper_id} for user {uid}")
+
+    def copy_paper(self, src_uid: str, dst_uid: str, doc_id: str) -> int:
+        """
+        Copy a paper entry and all its chunks (with their stored embeddings)
+        from one user's collection into another's. No re-embedding or LLM work.
+        Returns the number of entries copied.
+        """
+        source = self.get_collection(src_uid).get(
+            where={"doc_id": doc_id},
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not source or not source.get("ids"):
+            return 0
+
+        metadatas = [dict(m or {}, uid=dst_uid) for m in source["metadatas"]]
+        ids = [doc_id if m.get("entry_type") == "paper" else str(uuid.uuid4()) for m in metadatas]
+        self.get_collection(dst_uid).upsert(
+            ids=ids,
+            documents=source["documents"],
+            embeddings=source["embeddings"],
+            metadatas=metadatas
+        )
+
+        self.chunk_index.add_paper(dst_uid, doc_id)
+        chunk_total = sum(1 for m in metadatas if m.get("entry_type") == "chunk")
+        self.chunk_index.add_chunks(dst_uid, Counter({doc_id: chunk_total}))
+
+        def _add(index):
+            for chunk_id, doc, meta in zip(ids, source["documents"], metadatas):
+                if meta.get("entry_type") == "chunk":
+                    index.add(chunk_id, doc, doc_id)
+
+        self._update_lexical(dst_uid, _add)
+        self._notify_change(dst_uid, [doc_id])
+        logger.info(f"🔗 Re-linked paper {doc_id} from user {src_uid} to user {dst_uid} ({len(ids)} entries)")
+        return len(ids)
+
+    def scan_entries(self, uid: str, where: dict, include: list, page_size: int = 5000):
+        """Yield (chroma_id, metadata, document) for every entry matching `where`, paging through the collection."""
+        collection = self.get_collection(uid)
+        offset = 0
+        while True:
+            page = collection.get(where=where, include=include, limit=page_size, offset=offset)
+            ids = page.get("ids") or []
+            metas = page.get("metadatas") or []
+            docs = page.get("documents") or []
+            for i, _id in enumerate(ids):
+                meta = (metas[i] if i < len(metas) else None) or {}
+                doc = (docs[i] if i < len(docs) else None) or ""
+                yield _id, meta, doc
+            if len(ids) < page_size:
+                return
+            offset += page_size
+
+    def scan_metadatas(self, uid: str, where: dict, page_size: int = 5000):
+        """Yield (chroma_id, metadata) for every entry matching `where`."""
+        for _id, meta, _ in self.scan_entries(uid, where, ["metadatas"], page_size):
+            yield _id, meta
+
+    def rebuild_chunk_index(self, uid: str) -> dict:
+        """
+        Two bulk metadata scans (papers, chunks) instead of one query per paper.
+        Refreshes the maintained index and returns
+        {"papers": [(chroma_id, doc_id, title)], "chunk_counts": {doc_id: count}}.
+        """
+        papers = []
+
+        def _scan():
+            for _id, meta in self.scan_metadatas(uid, {"entry_type": "paper"}):
+                papers.append((_id, meta.get("doc_id") or _id, meta.get("title", "Untitled")))
+            counts = Counter()
+            for _, meta in self.scan_metadatas(uid, {"entry_type": "chunk"}):
+                if meta.get("doc_id"):
+                    counts[meta["doc_id"]] += 1
+            return {doc_id for _, doc_id, _ in papers}, counts
+
+        _, counts = self.chunk_index.rebuild(uid, _scan)
+        return {
+            "papers": papers,
+            "chunk_counts": {doc_id: counts.get(doc_id, 0) for _, doc_id, _ in papers}
+        }
+
+    def chunk_count(self, uid: str, doc_id: str) -> int:
+        """Enriched chunks stored for doc_id, from the maintained index."""
+        if not self.chunk_index.loaded(uid):
+            self.rebuild_chunk_index(uid)
+        return self.chunk_index.count(uid, doc_id)
+
+    def orphan_doc_ids(self, uid: str) -> list:
+        """doc_ids of papers with no enriched chunks, from the maintained index."""
+        if not self.chunk_index.loaded(uid):
+            self.rebuild_chunk_index(uid)
+        return self.chunk_index.orphans(uid)
+
+    def confirm_orphans(self, uid: str, doc_ids: list, batch_size: int = 500) -> list:
+        """
+        Of doc_ids, those that really have no chunks in Chroma, checked with
+        one bulk get per batch. Index entries found to be stale are corrected.
+        """
+        collection = self.get_collection(uid)
+        found = Counter()
+        for i in range(0, len(doc_ids), batch_size):
+            page = collection.get(
+                where={"$and": [{"entry_type": "chunk"}, {"doc_id": {"$in": doc_ids[i:i + batch_size]}}]},
+                include=["metadatas"]
+            )
+            found.update(m.get("doc_id") for m in page.get("metadatas") or [] if m and m.get("doc_id"))
+        if found:
+            self.chunk_index.add_chunks(uid, found)
+        return [doc_id for doc_id in doc_ids if not found.get(doc_id)]
+
+    def delete_entries(self, uid: str, chroma_ids: list, doc_ids: list, batch_size: int = 500):
+        """Batched delete of entries by Chroma id and of anything tagged with the given doc_ids."""
+        collection = self.get_collection(uid)
+        for i in range(0, len(chroma_ids), batch_size):
+            collection.delete(ids=chroma_ids[i:i + batch_size])
+        for i in range(0, len(doc_ids), batch_size):
+            collection.delete(where={"doc_id": {"$in": doc_ids[i:i + batch_size]}})
+        for doc_id in doc_ids:
+            self.chunk_index.remove_paper(uid, doc_id)
+
+        def _remove(index):
+            for doc_id in doc_ids:
+                index.remove_doc(doc_id)
+
+        self._update_lexical(uid, _remove)
+        self._notify_change(uid, doc_ids)
 
 # Global instance
 vector_store = VectorStore()
@@ -212,3 +212,30 @@ export const getAnalysisStatus = async (req, res) => {
     res.status(500).json({ error: "Failed to get analysis status" });
   }
 };
+
+export const analyzeBatch = async (req, res) => {
+  try {
+    const { uid, items, force } = req.body;
+    if (!uid) return res.status(400).json({ error: "UID missing" });
+    if (!Array.isArray(items) || items.length === 0) {
+      return res.status(400).json({ error: "items must be a non-empty array of PDF URLs or arXiv IDs" });
+    }
+
+    const response = await axios.post("http://127.0.0.1:8000/analyze_batch", { uid, items, force: !!force });
+    res.json(response.data);
+  } catch (err) {
+    console.error("analyzeBatch Error:", err.message);
+    const status = err.response?.status || 500;
+    res.status(status).json({ error: err.response?.data?.detail || "Failed to start batch analysis" });
+  }
+};
+
+export const getBatchStatus = async (req, res) => {
+  try {
+    const { batchId } = req.params;
+    const response = await axios.get(`http://127.0.0.1:8000/batch_status/${batchId}`);
+    res.json(response.data);
+  } catch (err) {
+    res.status(500).json({ error: "Failed to get batch status" });
+  }
+};
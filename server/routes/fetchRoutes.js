@@ -1,10 +1,12 @@
 import express from "express";
-import { fetchPapers, fetchAndSummarize, getAnalysisStatus } from "../controllers/fetchController.js";
+import { fetchPapers, fetchAndSummarize, getAnalysisStatus, analyzeBatch, getBatchStatus } from "../controllers/fetchController.js";
 
 const router = express.Router();
 
 router.post("/fetch", fetchPapers);
 router.post("/fetch_and_summarize", fetchAndSummarize);
 router.get("/status/:jobId", getAnalysisStatus);
+router.post("/analyze_batch", analyzeBatch);
+router.get("/batch_status/:batchId", getBatchStatus);
 
 export default router;